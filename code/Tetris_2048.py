@@ -4,30 +4,53 @@
 #                                                                              #
 ################################################################################
 
+import time  # used for timing the startup of the game
+# the time when this program started (see report_startup)
+startup_time = time.perf_counter()
+
 import lib.stddraw as stddraw  # for creating an animation with user interactions
-from lib.picture import Picture  # used for displaying an image on the game menu
+from lib.picture import cachedPicture, preloadPictures  # used for displaying the (cached) images
 from lib.color import Color  # used for coloring the game menu
 import os  # the os module is used for file and directory operations
 from game_grid import GameGrid  # the class for modeling the game grid
-from tetromino import Tetromino  # the class for modeling the tetrominoes
-import random  # used for creating tetrominoes with random types (shapes)
-import pygame
-import time
+from engine import Engine  # the headless game engine (rules and scoring)
+from scheduler import Scheduler  # the fixed timestep timers of the main loop
+from controls import Controls  # the keyboard controls (with auto repeat)
+from sounds import AudioManager  # the sound effects and the music
+from replay import record_game  # the recording of the games into replay files
+from bot import Bot, play_action  # the computer player
+
+# the (phase, time at its end) marks of the startup until the first frame (set
+# to None once they are reported)
+startup_marks = [("imports", time.perf_counter())]
+
+# Marks the end of a startup phase (see report_startup)
+def mark_startup(phase):
+   if startup_marks is not None:
+      startup_marks.append((phase, time.perf_counter()))
+
+# Prints the time each startup phase took until the first frame when the
+# environment variable TETRIS_STARTUP_REPORT is set (only once)
+def report_startup():
+   global startup_marks
+   if startup_marks is None:
+      return
+   if os.environ.get("TETRIS_STARTUP_REPORT"):
+      previous_time = startup_time
+      for phase, phase_time in startup_marks:
+         print("%-14s %7.1f ms" % (phase, (phase_time - previous_time) * 1000))
+         previous_time = phase_time
+      print("%-14s %7.1f ms" % ("first frame", (previous_time - startup_time) * 1000))
+   startup_marks = None
 
 # The main function where this program starts execution
 def start():
-   pygame.mixer.init()
-
-   # Sounds for different states of the game
+   # Sounds for different states of the game (loaded in the background while
+   # the window and the menu are being displayed) and the music
    current_dir = os.path.dirname(os.path.realpath(__file__))
-   lock_tetromino = pygame.mixer.Sound(current_dir + "/sounds/block_place.wav")
-   clear_line = pygame.mixer.Sound(current_dir + "/sounds/clear.wav")
-   loss = pygame.mixer.Sound(current_dir + "/sounds/lose.wav")
-   win = pygame.mixer.Sound(current_dir + "/sounds/win.wav")
-   merge = pygame.mixer.Sound(current_dir + "/sounds/merge.wav")
+   audio = AudioManager(current_dir + "/sounds")
+   mark_startup("audio")
    
-   # Score
-   score = 0
    # Button states
    paused = False
    muted = False
@@ -42,217 +65,257 @@ def start():
    # set the scale of the coordinate system for the drawing canvas
    stddraw.setXscale(-0.5, grid_w + 4 - 0.5)
    stddraw.setYscale(-0.5, grid_h - 0.5)
+   mark_startup("window")
 
-   # set the game grid dimension values stored and used in the Tetromino class
-   Tetromino.grid_height = grid_h
-   Tetromino.grid_width = grid_w
-   # create the game grid
-   grid = GameGrid(grid_h, grid_w)
-   # create the first tetromino to enter the game grid (and the second one so we can display it)
-   # by using the create_tetromino function defined below
-   tetromino_list = [create_tetromino(), create_tetromino()]
-   grid.current_tetromino = tetromino_list[0]
+   # the seed and the mode ("uniform" or "bag") of the piece generator of the
+   # games (every game gets a random seed unless TETRIS_SEED is set, so a game
+   # can be played again with the same pieces)
+   seed = os.environ.get("TETRIS_SEED")
+   seed = int(seed) if seed is not None else None
+   piece_mode = os.environ.get("TETRIS_PIECE_MODE", "uniform")
+   # create the game engine which models the game rules and the game grid
+   # (GameGrid adds the drawing methods on top of the headless rules)
+   engine = Engine(grid_h, grid_w, grid_class=GameGrid, seed=seed, piece_mode=piece_mode)
+   mark_startup("engine")
+   # the games are recorded into replay files in this directory when the
+   # environment variable TETRIS_REPLAY_DIR is set (see replay.py)
+   replay_dir = os.environ.get("TETRIS_REPLAY_DIR")
+   recorder = None
+   # the computer player plays instead of the keyboard when the environment
+   # variable TETRIS_BOT is set (to the number of the placements it looks
+   # ahead from, 0 for none, see bot.Bot)
+   bot_setting = os.environ.get("TETRIS_BOT")
+   bot = Bot(lookahead_width=int(bot_setting or 0)) if bot_setting is not None else None
+   # the actions planned by the bot and the (engine, locked count) of the
+   # tetromino they are planned for
+   bot_actions, bot_piece = [], None
    # display a simple menu before opening the game
    # by using the display_game_menu function defined below
    # game is muted or unmuted and difficulty level is chosen at the start menu
-   muted, difficulty = display_game_menu(grid_h, grid_w + 4)
-   
-   delay = 50
-   if difficulty == 2:
-      delay = 150
-   elif difficulty == 1:
-      delay = 500
-   
-   full_rows = []
+   muted, difficulty = display_game_menu(grid_h, grid_w + 4, audio)
+   # the keys pressed on the menu are not applied to the game
+   stddraw.clearKeyEvents()
+
+   # the intervals (in seconds) of the auto fall for the difficulty levels
+   gravity_intervals = {1: 0.5, 2: 0.15, 3: 0.05}
+   # the intervals (in seconds) of the input sampling, the actions of the bot
+   # and the rendering
+   input_interval, bot_interval, render_interval = 1 / 120, 0.05, 1 / 60
+   # the time (in seconds) the full rows are shown before they are removed
+   line_clear_interval = 0.5
+
+   # Starts recording the current game (when the games are recorded)
+   def start_recording():
+      nonlocal recorder
+      stop_recording()
+      if replay_dir:
+         recorder = record_game(engine, replay_dir)
+
+   # Finishes the recording of the current game (the file is finished by the
+   # writer thread of the recorder, so the game loop does not wait for it)
+   def stop_recording():
+      nonlocal recorder
+      if recorder is not None:
+         recorder.close()
+         recorder = None
 
    # Resets the whole game when called
    def reset(reset_buttons=True):
-      nonlocal score, grid, tetromino_list, full_rows, muted, paused
-      score = 0
-      grid = GameGrid(grid_h, grid_w)
-      tetromino_list = [create_tetromino(), create_tetromino()]
-      grid.current_tetromino = tetromino_list[0]
-      full_rows = []
+      nonlocal engine, muted, paused
+      stop_recording()
+      engine = Engine(grid_h, grid_w, grid_class=GameGrid, seed=seed, piece_mode=piece_mode)
       if reset_buttons:
          paused = False
          muted = False
-         pygame.mixer.music.set_volume(1)
+         audio.set_muted(False)
+      scheduler.set_enabled("line_clear", False)
+      controls.clear()
 
-   # the main game loop
-   while True:
-      restart_game = False
-      # if there is a full row that needs to be removed and its scores to be added
-      if len(full_rows) != 0:
-         score += grid.sum_scores_in_row(full_rows)
-         grid.remove_full_rows(full_rows)
-         if not muted:
-            clear_line.play()
-         full_rows = []
-         time.sleep(0.5)
-         if tetromino_list[1] is not None:
-            grid.display(score, paused, muted, next_=Tetromino.get_min_bounded_tile_matrix(tetromino_list[1]), delay=delay)
-         else:
-            grid.display(score, paused, muted, delay=delay)
+   # Displays the game grid with the current and the next tetrominoes (only
+   # the changed regions are drawn, the scheduler does the waiting)
+   def display():
+      next_tetromino = engine.next_tetromino
+      if next_tetromino is not None:
+         engine.grid.display(engine.score, paused, muted, next_=next_tetromino.get_min_bounded_tile_matrix(), delay=0)
+      else:
+         engine.grid.display(engine.score, paused, muted, delay=0)
+
+   # Resets the game and shows the menu (the timers are restarted after the
+   # menu so the time spent on it is not caught up)
+   def go_to_menu():
+      nonlocal muted, difficulty
+      reset()
+      muted, difficulty = display_game_menu(grid_h, grid_w + 4, audio)
+      scheduler.set_interval("gravity", gravity_intervals[difficulty])
+      scheduler.reset()
+      # the keys pressed on the menu are not applied to the new game
+      stddraw.clearKeyEvents()
+      start_recording()
+
+   # Checks for the mouse clicks on the buttons and the pressed keys
+   def handle_input():
+      nonlocal paused, muted
+      stddraw.pollEvents()
       if stddraw.mousePressed():
          x = stddraw.mouseX()
          y = stddraw.mouseY()
          # if a home button has been pressed
          if (x < 14 and x > 13) and (y > 15.75 and y < 16.75):
-            reset()
-            difficulty = 1
-            muted, difficulty = display_game_menu(grid_h, grid_w + 4)
-            delay = 50
-            if difficulty == 2:
-               delay = 150
-            elif difficulty == 1:
-               delay = 500
-            continue
+            go_to_menu()
+            return
          # if a pause button has been pressed
          elif (x < 13 and x > 12) and (y > 17 and y < 18):
             paused = not paused
             if paused:
-               pygame.mixer.music.stop()
+               audio.stop_music()
             else:
-               pygame.mixer.music.play()
-            continue
+               audio.restart_music()
+            return
          # if a mute button has been pressed
          elif (x < 15 and x > 14) and (y > 17 and y < 18):
             muted = not muted
-            if muted:
-               pygame.mixer.music.set_volume(0)
-            else:
-               pygame.mixer.music.set_volume(1)
+            audio.set_muted(muted)
 
-      is_hard_dropped = False
-      # check for any user interaction via the keyboard
-      if stddraw.hasNextKeyTyped():  # check if the user has pressed a key
-         key_typed = stddraw.nextKeyTyped()  # the most recently pressed key
+      # check for any user interaction via the keyboard (all the key events
+      # since the last tick are handled in the order they occurred, and the
+      # held keys repeat)
+      key_events = []
+      while stddraw.hasNextKeyEvent():
+         key_events.append(stddraw.nextKeyEvent())
+      # the keys typed are not used (the key events are)
+      stddraw.clearKeysTyped()
+      now = time.monotonic()
+      # the held keys do not repeat while the game is paused or the full rows
+      # are shown (the actions of the keys pressed meanwhile wait until the
+      # full rows are removed), so the missed repeats are not caught up later
+      controls.update(key_events, now, repeat=not paused and not engine.full_rows)
+      while controls.has_next_action() and not engine.full_rows:
+         key_typed = controls.next_action(now)
+         # only the reset key is used when the bot plays
+         if bot is not None and key_typed != "r":
+            continue
          # if the left arrow key has been pressed
          if key_typed == "left" and not paused:
             # move the active tetromino left by one
-            tetromino_list[0].move(key_typed, grid)
+            engine.move(key_typed)
          # if the right arrow key has been pressed
          elif key_typed == "right" and not paused:
             # move the active tetromino right by one
-            tetromino_list[0].move(key_typed, grid)
+            engine.move(key_typed)
          # if the down arrow key has been pressed
          elif key_typed == "down" and not paused:
             # move the active tetromino down by one
             # (soft drop: causes the tetromino to fall down faster)
-            tetromino_list[0].move(key_typed, grid)
+            engine.move(key_typed)
          elif key_typed == 'up' and not paused:
-            rotated = tetromino_list[0].rotate(grid)
+            engine.rotate()
          # if a hard dropping key 'h' has been pressed
          if key_typed == "h" and not paused:
-            is_hard_dropped = True
-            moved_down = True
-            while moved_down:
-               moved_down = tetromino_list[0].move("down", grid)
+            # drop the active tetromino and lock it onto the grid
+            if engine.hard_drop():
+               after_lock()
          # if a reset key 'r' has been pressed
          if key_typed == "r":
             reset(False)
-            continue
-         # clear the queue of the pressed keys for a smoother interaction
-         stddraw.clearKeysTyped()
+            start_recording()
 
-      # move the active tetromino down by one at each iteration (auto fall)
-      if not paused and not is_hard_dropped:
-         success = tetromino_list[0].move("down", grid)
+   # Applies the next action planned by the bot (the actions are planned when
+   # a new tetromino has entered)
+   def play_bot():
+      nonlocal bot_actions, bot_piece
+      if paused or engine.full_rows or engine.is_finished():
+         return
+      if bot_piece != (engine, engine.locked_count) or not bot_actions:
+         bot_actions = bot.plan(engine)
+         bot_piece = (engine, engine.locked_count)
+      action = bot_actions.pop(0)
+      if action == "drop":
+         if engine.hard_drop():
+            after_lock()
+      elif not play_action(engine, action):
+         # the tetromino is blocked (e.g. it has fallen meanwhile), so the
+         # actions are planned again from where it is
+         bot_actions = []
+
+   # Moves the active tetromino down by one (auto fall) and locks it onto
+   # the grid when it cannot go down anymore
+   def apply_gravity():
+      if paused or engine.full_rows:
+         return
+      if engine.step():
+         after_lock()
+
+   # Plays the sounds of a lock (nothing is played when muted) and ends the
+   # game or starts showing the full rows when needed
+   def after_lock():
+      audio.play("lock")
+      if engine.is_finished():
+         stop_recording()
+      # the game is over when a locked tile is above the game grid
+      if engine.game_over:
+         display()
+         audio.play("loss")
+         # the end screen is shown until the user presses a home button
+         engine.grid.display_end_screen(engine.score, is_loss=True)
+         go_to_menu()
+      # the game is won when a merge creates the 2048 tile
+      elif engine.won:
+         display()
+         audio.play("win")
+         engine.grid.display_end_screen(engine.score)
+         go_to_menu()
       else:
-         success = True
-      
-      # lock the active tetromino onto the grid when it cannot go down anymore
-      if not success or is_hard_dropped:
-         if not muted:
-            lock_tetromino.play()
-         # get the tile matrix of the tetromino without empty rows and columns
-         # and the position of the bottom left cell in this matrix
-         tiles, pos = tetromino_list[0].get_min_bounded_tile_matrix(True)
-         # update the game grid by locking the tiles of the landed tetromino
-         # if update method returns true, the game is over
-         if grid.update_grid(tiles, pos):
-            grid.display(score, paused, muted, delay=delay)
-            if not muted:
-               loss.play()
-            # the end screen is shown until the user presses a home button
-            grid.display_end_screen(score, is_loss=True)
-            reset()
-            difficulty = 1
-            muted, difficulty = display_game_menu(grid_h, grid_w + 4)
-            delay = 50
-            if difficulty == 2:
-               delay = 150
-            elif difficulty == 1:
-               delay = 500
-            restart_game = True
-            
-         if not restart_game:
-            # get a list of tuples which contain coordinates of tiles that need to be merged
-            # each two tuples are to be merged, the first one being the one below, the second above
-            merges = grid.check_merge()
-            grid.drop_the_clumps()
-         if merges and not restart_game:
-            while merges and not restart_game:
-               for i in range(len(merges)//2):
-                  new_tile_score = grid.merge_tiles(merges[i*2][0], merges[i*2][1])
-                  score += new_tile_score
-                  if new_tile_score == 2048:
-                     grid.display(score, paused, muted, delay=delay)
-                     if not muted:
-                        win.play()
-                     grid.display_end_screen(score)
-                     reset()
-                     difficulty = 1
-                     muted, difficulty = display_game_menu(grid_h, grid_w + 4)
-                     delay = 50
-                     if difficulty == 2:
-                        delay = 150
-                     elif difficulty == 1:
-                        delay = 500
-                     restart_game = True
-                     break
-               grid.drop_the_clumps()
-               merges = grid.check_merge()
-            if not muted:
-               merge.play()
+         if engine.merge_count:
+            audio.play("merge")
+         # the full rows are highlighted for a while (without blocking the
+         # game loop) and then removed by clear_full_rows
+         if engine.full_rows:
+            scheduler.set_enabled("line_clear", True)
 
-         if restart_game:
-            continue
+   # Removes the full rows and their highlights and adds their scores
+   def clear_full_rows():
+      scheduler.set_enabled("line_clear", False)
+      engine.clear_full_rows()
+      audio.play("clear")
+      # the tetromino that has entered meanwhile starts falling from now on
+      scheduler.reset("gravity")
 
-         full_rows = grid.find_full_rows()
+   # the controls that turn the key events into the actions of the game
+   controls = Controls()
 
-         # create the next tetromino to enter the game grid
-         # by using the create_tetromino function defined below
-         tetromino_list = [tetromino_list[1], create_tetromino()]
-         grid.current_tetromino = tetromino_list[0]
+   # the timers of the main loop (the input is handled before the gravity and
+   # the rendering comes last, the gravity catches up at most a few steps when
+   # the game loop is late)
+   scheduler = Scheduler()
+   scheduler.add("input", input_interval, handle_input)
+   scheduler.add("line_clear", line_clear_interval, clear_full_rows, enabled=False)
+   if bot is not None:
+      scheduler.add("bot", bot_interval, play_bot)
+   scheduler.add("gravity", gravity_intervals[difficulty], apply_gravity, max_catch_up=5)
+   scheduler.add("render", render_interval, display)
 
-      # display the game grid with the current tetromino
-      if tetromino_list[1] is not None:
-         grid.display(score, paused, muted, next_=Tetromino.get_min_bounded_tile_matrix(tetromino_list[1]), delay=delay)
-      else:
-         grid.display(score, paused, muted, delay=delay)
+   # the main game loop (the scheduler calls the timers that are due and then
+   # sleeps until the next one)
+   start_recording()
+   try:
+      while True:
+         scheduler.run_due()
+         scheduler.wait()
+   finally:
+      # the game is recorded to the end also when the window is closed (stddraw
+      # exits the program through sys.exit() on QUIT)
+      stop_recording()
       
    # print a message on the console when the game is over
    print("Game over")
    
-# A function for creating random shaped tetrominoes to enter the game grid
-def create_tetromino():
-   # the type (shape) of the tetromino is determined randomly
-   tetromino_types = ['I', 'O', 'Z', 'J', 'L', 'S', 'T']
-   random_index = random.randint(0, len(tetromino_types) - 1)
-   random_type = tetromino_types[random_index]
-   # create and return the tetromino
-   tetromino = Tetromino(random_type)
-   return tetromino
-
 # A function for displaying a simple menu before starting the game
-def display_game_menu(grid_height, grid_width):
+def display_game_menu(grid_height, grid_width, audio):
    # get the directory in which this python code file is placed
    current_dir = os.path.dirname(os.path.realpath(__file__))
    
    # Menu music
-   pygame.mixer.music.load(current_dir + "/sounds/tetris.ogg")
-   pygame.mixer.music.play(loops=-1)
+   audio.play_music("tetris.ogg")
    
    # the colors used for the menu
    background_color = Color(237, 224, 200)
@@ -264,8 +327,8 @@ def display_game_menu(grid_height, grid_width):
    img_file = current_dir + "/images/menu_image.png"
    # the coordinates to display the image centered horizontally
    img_center_x, img_center_y = (grid_width - 1) / 2, grid_height - 7
-   # the image is modeled by using the Picture class
-   image_to_display = Picture(img_file)
+   # the image is modeled by using the Picture class (read once and cached)
+   image_to_display = cachedPicture(img_file)
    # add the image to the drawing canvas
    stddraw.picture(image_to_display, img_center_x, img_center_y)
    # the dimensions for the start game button
@@ -285,7 +348,7 @@ def display_game_menu(grid_height, grid_width):
    sound_location = (button_blc_x + button_w / 2 - 1, button_blc_y + button_h + 1.25)
    muted_image = current_dir + "/images/menu_mute.png"
    unmuted_image = current_dir + "/images/menu_unmute.png"
-   stddraw.picture(Picture(unmuted_image),sound_location[0], sound_location[1])
+   stddraw.picture(cachedPicture(unmuted_image),sound_location[0], sound_location[1])
    muted = False
 
    diff_location = (sound_location[0]+2, sound_location[1])
@@ -293,12 +356,20 @@ def display_game_menu(grid_height, grid_width):
    image_1 = current_dir + "/images/1.png"
    image_2 = current_dir + "/images/2.png"
    image_3 = current_dir + "/images/3.png"
-   stddraw.picture(Picture(image_1), diff_location[0], diff_location[1])
+   stddraw.picture(cachedPicture(image_1), diff_location[0], diff_location[1])
 
+   # display the menu once (only the changed buttons are shown again)
+   stddraw.show(0)
+   mark_startup("menu")
+   report_startup()
+   # read the other images while the menu is shown (they are drawn from the
+   # picture cache)
+   images_dir = current_dir + "/images"
+   preloadPictures([images_dir + "/" + name for name in os.listdir(images_dir)])
    # the user interaction loop for the simple menu
    while True:
-      # display the menu and wait for a short time (50 ms)
-      stddraw.show(50)
+      # wait (without using the CPU) until the user does something
+      stddraw.waitForEvent()
       # check if the mouse has been left-clicked on the start game button
       if stddraw.mousePressed():
          # get the coordinates of the most recent location at which the mouse
@@ -307,9 +378,7 @@ def display_game_menu(grid_height, grid_width):
          # check if these coordinates are inside the button
          if mouse_x >= button_blc_x and mouse_x <= button_blc_x + button_w:
             if mouse_y >= button_blc_y and mouse_y <= button_blc_y + button_h:
-               pygame.mixer.music.stop()
-               pygame.mixer.music.load(current_dir + "/sounds/chronologica.ogg")
-               pygame.mixer.music.play(loops=-1)
+               audio.play_music("chronologica.ogg")
                return (muted, difficulty)
                break  # break the loop to end the method and start the game
          if mouse_x < (sound_location[0] + 0.5) and mouse_x > (sound_location[0] - 0.5):
@@ -317,25 +386,26 @@ def display_game_menu(grid_height, grid_width):
                stddraw.setPenColor(background_color)
                stddraw.filledRectangle(sound_location[0]-0.5, sound_location[1]-0.5, 1, 1)
                if muted:
-                  stddraw.picture(Picture(unmuted_image),sound_location[0], sound_location[1])
-                  pygame.mixer.music.set_volume(1)
+                  stddraw.picture(cachedPicture(unmuted_image),sound_location[0], sound_location[1])
                else:
-                  stddraw.picture(Picture(muted_image),sound_location[0], sound_location[1])
-                  pygame.mixer.music.set_volume(0)
+                  stddraw.picture(cachedPicture(muted_image),sound_location[0], sound_location[1])
                muted = not muted
+               audio.set_muted(muted)
+               stddraw.showRegions([(sound_location[0]-0.5, sound_location[1]-0.5, sound_location[0]+0.5, sound_location[1]+0.5)])
          if mouse_x < (diff_location[0] + 0.5) and mouse_x > (diff_location[0] - 0.5):
             if mouse_y < (diff_location[1] + 0.5) and mouse_y > (diff_location[1] - 0.5):
                stddraw.setPenColor(background_color)
                stddraw.filledRectangle(diff_location[0]-0.5, diff_location[1]-0.5, 1, 1)
                if difficulty == 3:
                   difficulty = 1
-                  stddraw.picture(Picture(image_1),diff_location[0], diff_location[1])
+                  stddraw.picture(cachedPicture(image_1),diff_location[0], diff_location[1])
                elif difficulty == 2:
                   difficulty = 3
-                  stddraw.picture(Picture(image_3),diff_location[0], diff_location[1])
+                  stddraw.picture(cachedPicture(image_3),diff_location[0], diff_location[1])
                else:
                   difficulty = 2
-                  stddraw.picture(Picture(image_2),diff_location[0], diff_location[1])
+                  stddraw.picture(cachedPicture(image_2),diff_location[0], diff_location[1])
+               stddraw.showRegions([(diff_location[0]-0.5, diff_location[1]-0.5, diff_location[0]+0.5, diff_location[1]+0.5)])
 
 # start() function is specified as the entry point (main function) from which
 # the program starts execution
@@ -0,0 +1,674 @@
+from tile import Tile  # used for giving the renderer a tile for each cell
+from point import Point  # used for tile positions
+import numpy as np  # fundamental Python module for scientific computing
+import random  # used for generating the Zobrist keys
+
+# the number of the tile exponents that have Zobrist keys (the game is won long
+# before a tile reaches 2 ** 31)
+ZOBRIST_EXPONENTS = 32
+# the seed of the Zobrist keys (the same keys in every process, so the hashes
+# can be shared and stored)
+ZOBRIST_SEED = 2048
+# the Zobrist keys for each number of cells (see get_zobrist_keys)
+_zobrist_keys = {}
+# the seed of the Zobrist keys of the pieces (another stream than the keys of
+# the cells, so no piece key is also the key of a cell)
+ZOBRIST_PIECE_SEED = ZOBRIST_SEED + 1
+# the tetromino types that have Zobrist piece keys
+ZOBRIST_PIECE_TYPES = "IOZJLST"
+# the Zobrist keys of the pieces for each grid size (see get_piece_zobrist_keys)
+_piece_zobrist_keys = {}
+
+# Returns the Zobrist keys of a grid with the given number of cells as a list
+# with a list of 64-bit keys for each cell (indexed by row * grid_width + col)
+# and a uint64 matrix of the same keys. The key of an empty cell (exponent 0) is
+# 0, so the hash of a grid is the XOR of the keys of its tiles.
+def get_zobrist_keys(n_cells):
+    keys = _zobrist_keys.get(n_cells)
+    if keys is None:
+        generator = random.Random(ZOBRIST_SEED)
+        key_lists = [[0] + [generator.getrandbits(64)
+                            for _ in range(ZOBRIST_EXPONENTS - 1)]
+                     for _ in range(n_cells)]
+        keys = (key_lists, np.array(key_lists, dtype=np.uint64))
+        _zobrist_keys[n_cells] = keys
+    return keys
+
+# Returns the Zobrist keys of the pieces (the tetrominoes to be placed) on a
+# grid with the given size: a dictionary with a 64-bit key for each (type,
+# rotation state), a list with a key for each column and a list with a key for
+# each row of the bottom left cell (the rows above the grid are taken modulo
+# the length of the list), and for each of the 4 tiles a list with a key for
+# each exponent. The key of a piece is the XOR of its keys (see
+# bot.get_piece_key), the same in every process unlike hash().
+def get_piece_zobrist_keys(grid_h, grid_w):
+    keys = _piece_zobrist_keys.get((grid_h, grid_w))
+    if keys is None:
+        generator = random.Random(ZOBRIST_PIECE_SEED)
+        shape_keys = {(shape, rotation): generator.getrandbits(64)
+                      for shape in ZOBRIST_PIECE_TYPES for rotation in range(4)}
+        column_keys = [generator.getrandbits(64) for _ in range(grid_w)]
+        row_keys = [generator.getrandbits(64) for _ in range(grid_h + 4)]
+        tile_keys = [[generator.getrandbits(64) for _ in range(ZOBRIST_EXPONENTS)]
+                     for _ in range(4)]
+        keys = (shape_keys, column_keys, row_keys, tile_keys)
+        _piece_zobrist_keys[(grid_h, grid_w)] = keys
+    return keys
+
+# A class for modeling the rules of the game grid without any drawing, so that
+# the game can be simulated without importing pygame (see engine.py).
+# Each cell of the grid is stored as the exponent of its tile number in a uint8
+# matrix (0 = empty cell, e = the tile 2 ** e), the colors of the tiles are
+# looked up by the exponent when they are drawn.
+class Board:
+    # A constructor for creating the game grid based on the given arguments
+    def __init__(self, grid_h, grid_w):
+        # set the dimensions of the game grid as the given arguments
+        self.grid_height = grid_h
+        self.grid_width = grid_w
+
+        # create an exponent matrix to store the tiles locked on the game grid
+        self.cells = np.zeros((grid_h, grid_w), dtype=np.uint8)
+        # the occupancy bitmask of each row (bit c is set when the cell in the
+        # column c is occupied) used for the fast collision checks in fits()
+        self.row_masks = [0] * grid_h
+        self.full_row_mask = (1 << grid_w) - 1
+        # the number of occupied cells in each row and the rows whose number
+        # has changed since the last call of find_full_rows
+        self.row_counts = [0] * grid_h
+        self.touched_rows = set()
+        # the height of each column (the row index of its topmost tile + 1, so
+        # 0 for an empty column) used for the hard drops and the stack analytics
+        self.column_heights = [0] * grid_w
+        # the lowest moved row of each column whose tiles have been moved
+        # outside a merge cascade (by the removal of the full rows), so the next
+        # merge_cascade checks them too
+        self.dirty_columns = {}
+        # the full rows that are highlighted until they are removed
+        self.highlighted_rows = set()
+        # create the tetromino that is currently being moved on the game grid
+        self.current_tetromino = None
+        # the game_over flag shows whether the game is over or not
+        self.game_over = False
+        # the 64-bit Zobrist hash of the cells (the XOR of the keys of the
+        # exponents of the tiles in their cells), kept up to date on every
+        # change of the cells so equal grids are found without comparing them
+        self.zobrist_keys, self.zobrist_matrix = get_zobrist_keys(grid_h * grid_w)
+        self.zobrist_hash = 0
+
+    # Returns a copy of the cells of this grid as bytes (a snapshot of the
+    # board that can be stored and restored later)
+    def snapshot(self):
+        return self.cells.tobytes()
+
+    # Returns a copy of this grid with its own cells (always a headless Board,
+    # also for a GameGrid, e.g. for simulating a lock without changing the game)
+    def copy(self):
+        board = Board.__new__(Board)
+        board.grid_height = self.grid_height
+        board.grid_width = self.grid_width
+        board.cells = self.cells.copy()
+        board.row_masks = list(self.row_masks)
+        board.full_row_mask = self.full_row_mask
+        board.row_counts = list(self.row_counts)
+        board.touched_rows = set(self.touched_rows)
+        board.column_heights = list(self.column_heights)
+        board.dirty_columns = dict(self.dirty_columns)
+        board.highlighted_rows = set(self.highlighted_rows)
+        board.current_tetromino = None
+        board.game_over = self.game_over
+        board.zobrist_keys = self.zobrist_keys
+        board.zobrist_matrix = self.zobrist_matrix
+        board.zobrist_hash = self.zobrist_hash
+        return board
+
+    # Restores the cells of this grid from a snapshot taken by snapshot()
+    def restore(self, snapshot):
+        cells = np.frombuffer(snapshot, dtype=np.uint8)
+        self.cells = cells.reshape(self.grid_height, self.grid_width).copy()
+        self.row_masks = [self.compute_row_mask(row) for row in range(self.grid_height)]
+        self.row_counts = np.count_nonzero(self.cells, axis=1).tolist()
+        self.touched_rows = set(range(self.grid_height))
+        self.column_heights = self.compute_column_heights()
+        # the restored tiles are checked from the bottom by the next cascade
+        self.dirty_columns = {col: 0 for col in range(self.grid_width)}
+        self.highlighted_rows = set()
+        self.zobrist_hash = self.compute_hash()
+
+    # Computes the Zobrist hash of the cells from scratch (used after the
+    # restores of the cells, the other changes update the hash incrementally)
+    def compute_hash(self):
+        return self.compute_rows_hash(0, self.grid_height)
+
+    # Computes the XOR of the Zobrist keys of the tiles in the rows from start
+    # up to (but not including) end
+    def compute_rows_hash(self, start, end):
+        exponents = self.cells[start:end].reshape(-1)
+        first = start * self.grid_width
+        keys = self.zobrist_matrix[np.arange(first, first + len(exponents)), exponents]
+        return int(np.bitwise_xor.reduce(keys)) if len(keys) else 0
+
+    # Updates the Zobrist hash for the cell with the given row and column
+    # indexes changing from the old exponent to the new one
+    def update_hash(self, row, col, old_exponent, new_exponent):
+        keys = self.zobrist_keys[row * self.grid_width + col]
+        self.zobrist_hash ^= keys[old_exponent] ^ keys[new_exponent]
+
+    # Computes the occupancy bitmask of the given row from the cells
+    def compute_row_mask(self, row):
+        bits = np.packbits(self.cells[row] != 0, bitorder='little')
+        return int.from_bytes(bits.tobytes(), 'little')
+
+    # Computes the height of each column from the cells
+    def compute_column_heights(self):
+        occupied = self.cells != 0
+        # the index of the topmost occupied cell of each column (from the top)
+        from_top = np.argmax(occupied[::-1], axis=0)
+        heights = np.where(occupied.any(axis=0), self.grid_height - from_top, 0)
+        return heights.tolist()
+
+    # Writes the given exponent (0 for an empty cell) to the given cell and
+    # keeps the row masks, the row counts, the column heights and the hash up
+    # to date (every single cell write that may change the occupancy of a cell
+    # goes through here)
+    def set_cell(self, row, col, exponent):
+        old_exponent = int(self.cells[row, col])
+        was_occupied = old_exponent != 0
+        self.cells[row, col] = exponent
+        keys = self.zobrist_keys[row * self.grid_width + col]
+        self.zobrist_hash ^= keys[old_exponent] ^ keys[exponent]
+        if exponent and not was_occupied:
+            self.row_masks[row] |= 1 << col
+            self.row_counts[row] += 1
+            self.touched_rows.add(row)
+            if row >= self.column_heights[col]:
+                self.column_heights[col] = row + 1
+        elif not exponent and was_occupied:
+            self.row_masks[row] &= ~(1 << col)
+            self.row_counts[row] -= 1
+            self.touched_rows.add(row)
+            if row == self.column_heights[col] - 1:
+                # the topmost tile is removed, find the next one below it
+                below = np.flatnonzero(self.cells[:row, col])
+                self.column_heights[col] = int(below[-1]) + 1 if len(below) else 0
+
+    # Returns the tile for drawing the cell with the given row and column
+    # indexes (None for an empty cell). The returned tile is shared by all the
+    # cells with the same number, so it must not be modified.
+    def get_tile(self, row, col):
+        exponent = int(self.cells[row, col])
+        if exponent == 0:
+            return None
+        return Tile.from_exponent(exponent, row in self.highlighted_rows)
+
+    # An object matrix with a tile (or None) for each cell, the same layout as
+    # the tile matrix of the tetrominoes (used by the renderer)
+    @property
+    def tile_matrix(self):
+        matrix = np.full((self.grid_height, self.grid_width), None)
+        for row, col in zip(*np.nonzero(self.cells)):
+            matrix[row][col] = self.get_tile(row, col)
+        return matrix
+
+    # Returns the number on the tile in the given cell (0 for an empty cell)
+    def get_number(self, row, col):
+        exponent = int(self.cells[row, col])
+        return 0 if exponent == 0 else 2 ** exponent
+
+    # A method used checking whether the grid cell with the given row and column
+    # indexes is occupied by a tile or not (i.e., empty)
+    def is_occupied(self, row, col):
+        # considering the newly entered tetrominoes to the game grid that may
+        # have tiles with position.y >= grid_height
+        if not self.is_inside(row, col):
+            return False  # the cell is not occupied as it is outside the grid
+        # the cell is occupied by a tile if its exponent is not 0
+        return self.cells[row, col] != 0
+
+    # A method for checking whether the cell with the given row and col indexes
+    # is inside the game grid or not
+    def is_inside(self, row, col):
+        if row < 0 or row >= self.grid_height:
+            return False
+        if col < 0 or col >= self.grid_width:
+            return False
+        return True
+
+    # Checks if a tetromino with the given row masks (see RotationState in
+    # tetromino.py) fits on the grid when its bottom left cell is at (x, y), that
+    # is, all of its tiles are inside the grid (or above it) and on empty cells
+    def fits(self, row_masks, x, y):
+        for dy, mask in row_masks:
+            row = y + dy
+            if x >= 0:
+                shifted = mask << x
+            else:
+                # the columns that are shifted out on the left must be empty
+                if mask & ((1 << -x) - 1):
+                    return False
+                shifted = mask >> -x
+            if shifted & ~self.full_row_mask or row < 0:
+                return False
+            if row < self.grid_height and self.row_masks[row] & shifted:
+                return False
+        return True
+
+    # Returns how far a tetromino in the given rotation state (see RotationState
+    # in tetromino.py) can fall when its bottom left cell is at (x, y). The
+    # column heights give the distance directly when the tetromino is above
+    # the stack, otherwise (below an overhang) it is moved down step by step.
+    def get_drop_distance(self, state, x, y):
+        distance = self.grid_height + y
+        for dx, dy in state.bottom_profile.items():
+            clearance = y + dy - self.column_heights[x + dx]
+            if clearance < 0:
+                # the tetromino is below the top of this column
+                distance = 0
+                while self.fits(state.row_masks, x, y - distance - 1):
+                    distance += 1
+                return distance
+            distance = min(distance, clearance)
+        return distance
+
+    # Returns the height of the highest column of the stack
+    def get_stack_height(self):
+        return max(self.column_heights)
+
+    # Returns the number of holes (the empty cells below the topmost tile of
+    # their column)
+    def count_holes(self):
+        return sum(self.column_heights) - sum(self.row_counts)
+
+    # A method that locks the tiles of a landed tetromino on the grid checking
+    # if the game is over due to having any tile above the topmost grid row.
+    # (This method returns True when the game is over and False otherwise.)
+    def update_grid(self, tiles_to_lock, blc_position):
+        # necessary for the display method to stop displaying the tetromino
+        self.current_tetromino = None
+        # lock the tiles of the current tetromino (tiles_to_lock) on the grid
+        n_rows, n_cols = len(tiles_to_lock), len(tiles_to_lock[0])
+        for col in range(n_cols):
+            for row in range(n_rows):
+                # place each tile (occupied cell) onto the game grid
+                if tiles_to_lock[row][col] is not None:
+                    # compute the position of the tile on the game grid
+                    pos = Point()
+                    pos.x = blc_position.x + col
+                    pos.y = blc_position.y + (n_rows - 1) - row
+                    # Check if the tile is inside the grid
+                    if self.is_inside(pos.y, pos.x):
+                        self.set_cell(pos.y, pos.x, tiles_to_lock[row][col].exponent)
+                    # If the tile is above the grid, end the game
+                    elif pos.y >= self.grid_height:
+                        self.game_over = True
+                        return True  # Immediately return to stop further processing
+        # return the value of the game_over flag
+        return self.game_over
+
+    # Locks the tiles of the given tetromino on the grid by using the tile
+    # positions from its rotation table (returns True when the game is over
+    # due to having any tile above the topmost grid row as update_grid does)
+    def lock_tetromino(self, tetromino):
+        self.current_tetromino = None
+        for row, col, tile in tetromino.get_tile_positions():
+            if row >= self.grid_height:
+                self.game_over = True
+            else:
+                self.set_cell(row, col, tile.exponent)
+        return self.game_over
+
+    # Checks if there are the same tiles on top of each other
+    # if it finds any, adds coordinates of both tiles to the list which is then returned
+    def check_merge(self):
+        cells = self.cells
+        # same[r][c] is True when the cells (r, c) and (r + 1, c) can be merged
+        same = (cells[1:] == cells[:-1]) & (cells[:-1] != 0)
+        merges = []
+        # only the lowest pair of each column is merged in one pass
+        for col in np.nonzero(same.any(axis=0))[0]:
+            row = int(np.argmax(same[:, col]))
+            merges.append((row, int(col)))
+            merges.append((row + 1, int(col)))
+        return merges
+
+    # Merges the tiles and drops the floating clumps until there is nothing left
+    # to merge, checking only the cells that have changed. The given cells (the
+    # (row, col) of the tiles locked or moved by the caller) and the dirty
+    # columns (see remove_full_rows) are checked first, then each merge and
+    # each clump drop marks the cells it changes. Returns the
+    # ordered list of the (row, col, new_number) merge events and their total
+    # score (the sum of the new numbers).
+    def merge_cascade(self, changed_cells):
+        # the lowest changed row of each changed column (the worklist)
+        dirty, self.dirty_columns = self.dirty_columns, {}
+        for row, col in changed_cells:
+            dirty[col] = min(row, dirty.get(col, row))
+        events, score = [], 0
+        while dirty:
+            for col in sorted(dirty):
+                # the tile below the lowest changed cell may merge with it
+                start = max(dirty[col] - 1, 0)
+                row = self.find_merge_in_column(col, start)
+                while row is not None:
+                    number = self.merge_tiles(row, col)
+                    events.append((row, col, number))
+                    score += number
+                    # the new tile may merge with the tile below or above it
+                    row = self.find_merge_in_column(col, max(row - 1, 0))
+            # the merges may leave clumps floating, the columns of the moved
+            # tiles are checked again
+            dirty = {}
+            for src, (row, col) in self.drop_the_clumps():
+                dirty[col] = min(row, dirty.get(col, row))
+        return events, score
+
+    # Returns the lowest row (at least start) whose tile can be merged with the
+    # tile above it in the given column, or None when there is no such row
+    def find_merge_in_column(self, col, start):
+        # the cells above the topmost tile of the column are empty
+        end = self.column_heights[col]
+        if end - start < 2:
+            return None
+        column = self.cells[start:end, col]
+        same = (column[1:] == column[:-1]) & (column[:-1] != 0)
+        if not same.any():
+            return None
+        return start + int(np.argmax(same))
+
+    # Merges two tiles (upper one is removed, lower one is doubled)
+    def merge_tiles(self, row, col):
+        exponent = int(self.cells[row, col])
+        if exponent != 0:
+            self.cells[row, col] = exponent + 1
+            self.update_hash(row, col, exponent, exponent + 1)
+            if row + 1 < self.grid_height:  # Ensure row + 1 is within bounds
+                self.set_cell(row + 1, col, 0)
+            self.fall_after_merge(row, col)
+        return self.get_number(row, col)
+
+    # Moves the column above the tiles after a merge
+    def fall_after_merge(self, row, col):
+        column = self.cells[:, col]
+        start = row + 2
+        if start >= self.grid_height:
+            return
+        # the tiles above the removed tile up to the first empty cell fall by 1
+        empty = np.nonzero(column[start:] == 0)[0]
+        end = start + int(empty[0]) if len(empty) else self.grid_height
+        if end > start:
+            segment = column[start:end].copy()
+            # only the occupancy of the cell of the topmost tile (now empty) and
+            # the cell of the removed tile (now filled) change
+            self.set_cell(end - 1, col, 0)
+            self.set_cell(start - 1, col, segment[0])
+            column[start:end - 1] = segment[1:]
+            for row in range(start, end - 1):
+                self.update_hash(row, col, segment[row - start], segment[row - start + 1])
+
+    # Labels the (four-way) connected groups of tiles on the grid in one pass
+    # from the bottom row with an iterative union-find, so there is no
+    # recursion limit on the size of the grid. The union-find joins the runs of
+    # each row (the consecutive tiles, read from the row masks) instead of the
+    # single tiles: a run is joined with the runs of the row below it that have
+    # a column in common with it. Returns the (row, first col, last col) of
+    # each run (ordered by the row and then by the column) and the root of the
+    # group of each run (the index of its first run, so the groups that touch
+    # the bottom row have the roots of the runs of the bottom row).
+    def label_runs(self):
+        runs, parent = [], []
+
+        # finds the root of the given run (with path halving)
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # the indexes of the runs of the row below
+        below = []
+        # the rows above the highest column are empty
+        for row in range(max(self.column_heights)):
+            mask, col, current = self.row_masks[row], 0, []
+            while mask:
+                # skip the empty cells and count the occupied ones after them
+                skip = (mask & -mask).bit_length() - 1
+                mask >>= skip
+                col += skip
+                length = (~mask & (mask + 1)).bit_length() - 1
+                first, last = col, col + length - 1
+                index = len(runs)
+                runs.append((row, first, last))
+                parent.append(index)
+                for other in below:
+                    _, other_first, other_last = runs[other]
+                    if other_first <= last and first <= other_last:
+                        root_a, root_b = find(index), find(other)
+                        # the smaller index is kept as the root of the
+                        # joined group
+                        if root_a != root_b:
+                            parent[max(root_a, root_b)] = min(root_a, root_b)
+                current.append(index)
+                mask >>= length
+                col += length
+            below = current
+        return runs, [find(i) for i in range(len(runs))]
+
+    # Returns the label matrix of the groups of tiles (0 for the empty cells
+    # and 1, 2, ... for the groups in the order of their lowest leftmost tiles,
+    # see label_runs) and the set of the labels of the groups that touch the
+    # bottom row (the other groups are floating clumps)
+    def label_components(self):
+        labels = np.zeros((self.grid_height, self.grid_width), dtype=np.int32)
+        runs, roots = self.label_runs()
+        numbers = {}
+        for (row, first, last), root in zip(runs, roots):
+            labels[row, first:last + 1] = numbers.setdefault(root, len(numbers) + 1)
+        grounded = {numbers[root] for (row, first, last), root in zip(runs, roots)
+                    if row == 0}
+        return labels, grounded
+
+    # Returns a complete list of floating clumps (sets of the locations of the
+    # connected tiles that do not touch the bottom row) in the order of their
+    # lowest leftmost tiles
+    def get_list_of_clumps(self):
+        runs, roots = self.label_runs()
+        grounded = {root for (row, first, last), root in zip(runs, roots) if row == 0}
+        clumps = {}
+        for (row, first, last), root in zip(runs, roots):
+            if root not in grounded:
+                clump = clumps.setdefault(root, set())
+                clump.update((row, col) for col in range(first, last + 1))
+        return list(clumps.values())
+
+    # Moves all the floating clumps down until none of them is floating. All
+    # the clumps fall together and each one stops as soon as it touches the
+    # bottom row or a grounded tile (also the tiles of the clumps that have
+    # stopped before it), so the final position of each clump is computed
+    # directly and the tiles are moved only once. Returns the list of the
+    # ((from_row, col), (to_row, col)) moves of the tiles (used for animations).
+    def drop_the_clumps(self):
+        # without any holes every tile stands on the tiles below it
+        if self.count_holes() == 0:
+            return []
+        clumps = self.get_list_of_clumps()
+        if not clumps:
+            return []
+        # the cells of the grounded tiles (the clumps are added as they stop)
+        solid = self.cells != 0
+        for clump in clumps:
+            for row, col in clump:
+                solid[row, col] = False
+        remaining = clumps
+        moves = []
+        fallen = 0  # the distance that all the remaining clumps have fallen
+        while remaining:
+            distances = [self._get_fall_distance(clump, fallen, solid)
+                         for clump in remaining]
+            step = min(distances)
+            fallen += step
+            still_falling = []
+            for clump, distance in zip(remaining, distances):
+                if distance > step:
+                    still_falling.append(clump)
+                    continue
+                # this clump stops at the current distance
+                for row, col in clump:
+                    solid[row - fallen, col] = True
+                    if fallen > 0:
+                        moves.append(((row, col), (row - fallen, col)))
+            remaining = still_falling
+        # move the tiles (all the cells are read before any of them is written)
+        exponents = [self.cells[src] for src, dst in moves]
+        for src, dst in moves:
+            self.set_cell(src[0], src[1], 0)
+        for (src, dst), exponent in zip(moves, exponents):
+            self.set_cell(dst[0], dst[1], exponent)
+        return moves
+
+    # Returns how much further the given clump (that has already fallen by the
+    # given distance) can fall until it touches the bottom row or a solid cell
+    def _get_fall_distance(self, clump, fallen, solid):
+        distance = self.grid_height
+        for row, col in clump:
+            row -= fallen
+            # the bottom row
+            distance = min(distance, row)
+            # the highest solid cell below the tile in the same column
+            below = np.flatnonzero(solid[:row, col])
+            if len(below):
+                distance = min(distance, row - int(below[-1]) - 1)
+            # the highest solid cell at most as high as the tile in the columns
+            # on the left and on the right
+            for side in (col - 1, col + 1):
+                if 0 <= side < self.grid_width:
+                    beside = np.flatnonzero(solid[:row + 1, side])
+                    if len(beside):
+                        distance = min(distance, row - int(beside[-1]))
+        return distance
+
+    # Finds full rows, highlights them and returns row indexes (only the rows
+    # whose number of tiles has changed since the last call are checked)
+    def find_full_rows(self):
+        for row in self.touched_rows:
+            if self.row_counts[row] == self.grid_width:
+                self.highlighted_rows.add(row)
+        self.touched_rows = set()
+        return sorted(self.highlighted_rows)
+
+    # Removes the given rows and moves the tiles above them down in one step
+    # (the rows are given by their indexes before any of them is removed)
+    def remove_full_rows(self, rows):
+        removed = set(rows)
+        if not removed:
+            return
+        kept = [row for row in range(self.grid_height) if row not in removed]
+        n_kept = len(kept)
+        lowest = min(removed)
+        # the hash is updated incrementally: the keys of the tiles from the
+        # lowest removed row up to the top of the stack are removed (the tiles
+        # of the removed rows and the moved tiles at their old cells) and the
+        # keys of the moved tiles at their new cells are added after the move
+        self.zobrist_hash ^= self.compute_rows_hash(lowest, max(self.column_heights))
+        # compact the kept rows to the bottom and empty the rows on the top
+        self.cells[:n_kept] = self.cells[kept]
+        self.cells[n_kept:] = 0
+        n_removed = self.grid_height - n_kept
+        self.row_masks = [self.row_masks[row] for row in kept] + [0] * n_removed
+        self.row_counts = [self.row_counts[row] for row in kept] + [0] * n_removed
+        self.column_heights = self.compute_column_heights()
+        self.zobrist_hash ^= self.compute_rows_hash(lowest, max(self.column_heights))
+        # the rows above the lowest removed row have new tiles, and the tiles
+        # moved down may merge with the tiles below them (in the next cascade)
+        self.touched_rows.update(range(lowest, self.grid_height))
+        for col in range(self.grid_width):
+            self.dirty_columns[col] = min(lowest, self.dirty_columns.get(col, lowest))
+        self.highlighted_rows = set()
+
+    # Sums values of tiles in full rows
+    def sum_scores_in_row(self, rows):
+        exponents = self.cells[rows].astype(np.int64)
+        numbers = np.where(exponents != 0, 1 << exponents, 0)
+        return int(numbers.sum())
+
+# Returns the label matrix and the set of the grounded labels of the groups of
+# tiles of the given grid found by searching the neighbors of each tile (the
+# plain reference that label_components is checked against)
+def _label_cells(board):
+    labels = np.zeros((board.grid_height, board.grid_width), dtype=np.int32)
+    count = 0
+    for row, col in zip(*np.nonzero(board.cells)):
+        if labels[row, col]:
+            continue
+        count += 1
+        labels[row, col] = count
+        stack = [(row, col)]
+        while stack:
+            row, col = stack.pop()
+            for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+                if board.is_inside(r, c) and board.cells[r, c] and not labels[r, c]:
+                    labels[r, c] = count
+                    stack.append((r, c))
+    return labels, set(labels[0][labels[0] != 0].tolist())
+
+# Returns the lowest row (at least start) whose tile can be merged with the
+# tile above it in the given column of the given grid by reading the whole
+# column (the reference that find_merge_in_column is checked against)
+def _find_merge_in_cells(board, col, start):
+    for row in range(start, board.grid_height - 1):
+        if board.cells[row, col] and board.cells[row, col] == board.cells[row + 1, col]:
+            return row
+    return None
+
+# Checks label_components, get_list_of_clumps and drop_the_clumps (which skips
+# the grids without holes) on the given number of random grids against
+# _label_cells, and find_merge_in_column (which stops at the column height)
+# against _find_merge_in_cells, and the Zobrist hash kept up to date by the
+# clump drops and the removal of the full rows against compute_hash. Returns
+# the number of the grids they do not match on.
+def check_random_boards(n_boards=3000, seed=0):
+    generator = random.Random(seed)
+    mismatches = 0
+    for _ in range(n_boards):
+        board = Board(generator.randint(1, 24), generator.randint(1, 14))
+        density = generator.random()
+        for row in range(generator.randint(0, board.grid_height)):
+            for col in range(board.grid_width):
+                if generator.random() < density:
+                    board.set_cell(row, col, generator.randint(1, 4))
+        merges = [(board.find_merge_in_column(col, start),
+                   _find_merge_in_cells(board, col, start))
+                  for col in range(board.grid_width)
+                  for start in range(board.grid_height)]
+        if any(found != expected for found, expected in merges):
+            mismatches += 1
+            continue
+        labels, grounded = _label_cells(board)
+        clumps = {}
+        for row, col in zip(*np.nonzero(labels)):
+            if labels[row, col] not in grounded:
+                clumps.setdefault(labels[row, col], set()).add((int(row), int(col)))
+        expected = (labels.tolist(), grounded, list(clumps.values()))
+        actual_labels, actual_grounded = board.label_components()
+        actual = (actual_labels.tolist(), actual_grounded, board.get_list_of_clumps())
+        # the tiles are moved exactly when there are floating clumps (a clump
+        # above the bottom row always falls)
+        if expected != actual or (not clumps) != (not board.drop_the_clumps()):
+            mismatches += 1
+            continue
+        board.remove_full_rows(board.find_full_rows())
+        if board.zobrist_hash != board.compute_hash():
+            mismatches += 1
+    return mismatches
+
+# Checks the groups of tiles, the merges and the hash on random grids (see
+# check_random_boards):
+#   python board.py [boards]
+def _main():
+    import sys
+    n_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    mismatches = check_random_boards(n_boards)
+    print("boards: %d, mismatches: %d" % (n_boards, mismatches))
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,332 @@
+################################################################################
+#                                                                              #
+# The computer player of Tetris 2048 (placement enumeration and heuristics)    #
+#                                                                              #
+################################################################################
+
+from collections import deque  # the search of the reachable placements
+import time  # used for timing the decisions
+import numpy as np  # used for the features of the heuristic
+from tetromino import ROTATION_TABLES, KICK_TABLES  # the rotation states
+from engine import Engine, WINNING_NUMBER  # the headless game engine
+from transposition import TranspositionTable, KEY_MASK  # the evaluations
+from board import get_piece_zobrist_keys  # the keys of the pieces
+
+# the weights of the features of the default heuristic (see WeightedHeuristic)
+DEFAULT_WEIGHTS = {
+    "height": -0.5,         # the sum of the column heights
+    "max_height": -1.0,     # the height of the highest column
+    "holes": -4.0,          # the empty cells below the top of their column
+    "bumpiness": -0.3,      # the height differences of the adjacent columns
+    "score": 0.05,          # the score gained by the merges and the rows
+    "merge_potential": 0.8, # the columns topped by a 2 or a 4 (new tiles can
+                            # merge with them)
+    "adjacency": 0.3,       # the pairs of equal numbers side by side
+}
+
+# the multiplier that mixes the score gained before a state into its key
+SCORE_KEY = 0x9E3779B97F4A7C15
+
+# A class for modeling a placement of a tetromino: its rotation state and the
+# column of its bottom left cell when it is dropped, the row it lands on and
+# the actions (left, right, rotate and drop) that take it there
+class Placement:
+    def __init__(self, rotation, x, y, actions):
+        self.rotation = rotation
+        self.x = x
+        self.y = y
+        self.actions = actions
+
+# A class for modeling the outcome of a placement: the grid after the lock (with
+# the merges done, the clumps dropped and the full rows removed), the score
+# gained and how the game ends (lost or won) when it does
+class Outcome:
+    def __init__(self, board, score, merges, rows, lost, won):
+        self.board = board
+        self.score = score
+        self.merges = merges
+        self.rows = rows
+        self.lost = lost
+        self.won = won
+
+# Returns the placements that the tetromino of the given type can reach on the
+# given grid from the given rotation state and bottom left cell (x, y) by
+# moving left and right and rotating (as the player does before a hard drop).
+# The placements are found with a breadth first search, so each rotation and
+# column is reached with the fewest actions.
+def find_placements(board, shape, rotation, x, y):
+    table, kicks = ROTATION_TABLES[shape], KICK_TABLES[shape]
+    start = (rotation, x, y)
+    # the (previous state, action) of each reached state
+    parents = {start: None}
+    states = deque([start])
+    found = {}
+    # a rotation that kicks upwards is not followed above this row
+    max_y = board.grid_height + 1
+    while states:
+        state = states.popleft()
+        rotation, x, y = state
+        if (rotation, x) not in found:
+            found[(rotation, x)] = state
+        row_masks = table[rotation].row_masks
+        neighbors = []
+        if board.fits(row_masks, x - 1, y):
+            neighbors.append(((rotation, x - 1, y), "left"))
+        if board.fits(row_masks, x + 1, y):
+            neighbors.append(((rotation, x + 1, y), "right"))
+        next_rotation = (rotation + 1) % 4
+        for dx, dy in kicks[rotation]:
+            if board.fits(table[next_rotation].row_masks, x + dx, y + dy):
+                if y + dy <= max_y:
+                    neighbors.append(((next_rotation, x + dx, y + dy), "rotate"))
+                break
+        for neighbor, action in neighbors:
+            if neighbor not in parents:
+                parents[neighbor] = (state, action)
+                states.append(neighbor)
+    placements = []
+    for (rotation, x), state in found.items():
+        actions = ["drop"]
+        step = parents[state]
+        while step is not None:
+            actions.append(step[1])
+            step = parents[step[0]]
+        actions.reverse()
+        y = state[2] - board.get_drop_distance(table[rotation], x, state[2])
+        placements.append(Placement(rotation, x, y, actions))
+    return placements
+
+# Locks a tetromino of the given type with the given tile exponents (in the
+# tile order) at the given placement on a copy of the given grid as the engine
+# does (the merge cascade, the clump drops and the full rows) and returns the
+# Outcome. The full rows are removed right away.
+def simulate(board, shape, exponents, placement):
+    board = board.copy()
+    state = ROTATION_TABLES[shape][placement.rotation]
+    x, y = placement.x, placement.y
+    locked_cells = []
+    lost = False
+    for (dx, dy), exponent in zip(state.offsets, exponents):
+        if y + dy >= board.grid_height:
+            lost = True
+        else:
+            board.set_cell(y + dy, x + dx, exponent)
+            locked_cells.append((y + dy, x + dx))
+    if lost:
+        return Outcome(board, 0, 0, 0, True, False)
+    events, score = board.merge_cascade(locked_cells)
+    won = any(number == WINNING_NUMBER for row, col, number in events)
+    rows = board.find_full_rows()
+    if rows:
+        score += board.sum_scores_in_row(rows)
+        board.remove_full_rows(rows)
+    return Outcome(board, score, len(events), len(rows), False, won)
+
+# Returns the key of the state right after a tetromino of the given type with
+# the given tile exponents is locked at the given placement on the given grid
+# (before the merges) with the given score gained before it, or None when the
+# placement loses the game. The key is the Zobrist hash of the grid (see
+# Board.zobrist_hash) with the locked tiles added, so the placements that lock
+# the same numbers on the same cells (e.g. two rotations of an O tetromino)
+# have the same key and the same outcome.
+def get_placement_key(board, shape, exponents, placement, base_score=0):
+    state = ROTATION_TABLES[shape][placement.rotation]
+    key = board.zobrist_hash
+    for (dx, dy), exponent in zip(state.offsets, exponents):
+        row, col = placement.y + dy, placement.x + dx
+        if row >= board.grid_height:
+            return None
+        key ^= board.zobrist_keys[row * board.grid_width + col][exponent]
+    return (key ^ (base_score * SCORE_KEY)) & KEY_MASK
+
+# Returns the Zobrist key of a piece of the given type with the given tile
+# exponents (in the tile order) in the given rotation state with its bottom
+# left cell at (x, y) on the given grid (see get_piece_zobrist_keys), which is
+# mixed into the keys of the states it is placed after
+def get_piece_key(board, shape, exponents, rotation, x, y):
+    shape_keys, column_keys, row_keys, tile_keys = get_piece_zobrist_keys(
+        board.grid_height, board.grid_width)
+    key = shape_keys[(shape, rotation)] ^ column_keys[x % len(column_keys)] \
+        ^ row_keys[y % len(row_keys)]
+    for keys, exponent in zip(tile_keys, exponents):
+        key ^= keys[exponent]
+    return key
+
+# Returns the features of the given outcome used by the heuristics (see
+# DEFAULT_WEIGHTS)
+def get_features(outcome):
+    board = outcome.board
+    heights = board.column_heights
+    cells = board.cells
+    tops = [cells[height - 1, col] for col, height in enumerate(heights) if height]
+    same = (cells[:, 1:] == cells[:, :-1]) & (cells[:, 1:] != 0)
+    return {
+        "height": sum(heights),
+        "max_height": max(heights),
+        "holes": board.count_holes(),
+        "bumpiness": sum(abs(a - b) for a, b in zip(heights, heights[1:])),
+        "score": outcome.score,
+        "merge_potential": sum(1 for top in tops if top <= 2),
+        "adjacency": int(np.count_nonzero(same)),
+    }
+
+# A class for the heuristics that evaluate an outcome as the weighted sum of its
+# features (a lost game is the worst and a won game is the best outcome). Any
+# callable that takes an Outcome and returns a number can be used as the
+# heuristic of a bot.
+class WeightedHeuristic:
+    def __init__(self, weights=DEFAULT_WEIGHTS):
+        self.weights = dict(weights)
+
+    def __call__(self, outcome):
+        if outcome.lost:
+            return float("-inf")
+        if outcome.won:
+            return float("inf")
+        features = get_features(outcome)
+        return sum(weight * features[name] for name, weight in self.weights.items())
+
+# A class for the computer player that chooses the placement of the current
+# tetromino by simulating every reachable placement and evaluating the outcomes
+# with its heuristic. With the lookahead, the best few placements are also
+# evaluated with the best placement of the next tetromino after them. The
+# evaluations are kept in a transposition table, so a state reached by more
+# than one placement (or looked ahead more than once) is evaluated only once.
+class Bot:
+    # A constructor for creating a bot with the given heuristic, which looks
+    # ahead to the next tetromino for the best lookahead_width placements (0
+    # turns the lookahead off, each placement looked ahead costs about as much
+    # as evaluating all the placements of the current tetromino) and keeps
+    # table_size evaluations
+    def __init__(self, heuristic=None, lookahead_width=0, table_size=1 << 16):
+        self.heuristic = heuristic if heuristic is not None else WeightedHeuristic()
+        self.lookahead_width = lookahead_width
+        # the evaluations keyed by get_placement_key (the value of the outcome
+        # of a placement at depth 0, and at depth 1 the value of the best
+        # placement of the next tetromino after it, with the key of the next
+        # tetromino mixed in)
+        self.table = TranspositionTable(table_size)
+        # the number and the total time (in seconds) of the decisions
+        self.decision_count = 0
+        self.decision_time = 0.0
+
+    # Returns the (value, placement, outcome, key) of each reachable placement
+    # of the given tetromino on the given grid (the given score is added to the
+    # scores of the outcomes, e.g. the score of a placement before this one).
+    # The outcome is None when the value is found in the table.
+    def evaluate_placements(self, board, tetromino, base_score=0):
+        position = tetromino.bottom_left_cell
+        placements = find_placements(board, tetromino.type, tetromino.rotation_state,
+                                     position.x, position.y)
+        exponents = [tile.exponent for tile in tetromino.tiles]
+        scored = []
+        for placement in placements:
+            key = get_placement_key(board, tetromino.type, exponents, placement,
+                                    base_score)
+            entry = self.table.lookup(key) if key is not None else None
+            if entry is not None:
+                scored.append((entry[1], placement, None, key))
+                continue
+            outcome = simulate(board, tetromino.type, exponents, placement)
+            outcome.score += base_score
+            value = self.heuristic(outcome)
+            if key is not None:
+                self.table.store(key, 0, value)
+            scored.append((value, placement, outcome, key))
+        return scored
+
+    # Returns the value of the best placement of the given next tetromino after
+    # the given placement of the given tetromino on the given grid (the outcome
+    # of the placement is simulated when it is None), where key is the key of
+    # the state after the placement with the key of the next tetromino mixed in
+    def look_ahead(self, board, tetromino, placement, outcome, key, next_tetromino):
+        entry = self.table.lookup(key)
+        if entry is not None and entry[0] >= 1:
+            return entry[1]
+        if outcome is None:
+            exponents = [tile.exponent for tile in tetromino.tiles]
+            outcome = simulate(board, tetromino.type, exponents, placement)
+        after = self.evaluate_placements(outcome.board, next_tetromino, outcome.score)
+        value, best = max(((next_value, next_placement)
+                           for next_value, next_placement, _, _ in after),
+                          key=lambda item: item[0])
+        self.table.store(key, 1, value, (best.rotation, best.x))
+        return value
+
+    # Returns the best placement of the current tetromino of the given engine
+    # (None when the game has ended)
+    def choose_placement(self, engine):
+        if engine.is_finished():
+            return None
+        start_time = time.perf_counter()
+        self.table.new_search()
+        board, tetromino = engine.grid, engine.current_tetromino
+        scored = self.evaluate_placements(board, tetromino)
+        scored.sort(key=lambda item: item[0], reverse=True)
+        next_tetromino = engine.next_tetromino
+        piece_key = 0
+        if next_tetromino is not None:
+            position = next_tetromino.bottom_left_cell
+            piece_key = get_piece_key(board, next_tetromino.type,
+                                      [tile.exponent for tile in next_tetromino.tiles],
+                                      next_tetromino.rotation_state, position.x, position.y)
+        best_value, best = float("-inf"), scored[0][1] if scored else None
+        for rank, (value, placement, outcome, key) in enumerate(scored):
+            # the placements that end the game are not looked ahead
+            if rank < self.lookahead_width and next_tetromino is not None \
+                    and key is not None and abs(value) != float("inf"):
+                value = self.look_ahead(board, tetromino, placement, outcome,
+                                        key ^ piece_key, next_tetromino)
+            if value > best_value:
+                best_value, best = value, placement
+        self.decision_count += 1
+        self.decision_time += time.perf_counter() - start_time
+        return best
+
+    # Returns the actions (see Placement) that play the best placement of the
+    # current tetromino of the given engine
+    def plan(self, engine):
+        placement = self.choose_placement(engine)
+        return list(placement.actions) if placement is not None else []
+
+# Applies the given action of a placement to the given engine and returns
+# whether it has been applied (a move or a rotation can be blocked)
+def play_action(engine, action):
+    if action == "rotate":
+        return engine.rotate()
+    if action == "drop":
+        return engine.hard_drop()
+    return engine.move(action)
+
+# A function that plays a game with the given bot (a hard drop for every
+# tetromino, without gravity) until it ends or max_pieces tetrominoes are
+# locked and returns the engine of the game
+def play_bot_game(bot, grid_h=20, grid_w=12, max_pieces=1000, seed=None):
+    engine = Engine(grid_h, grid_w, seed=seed)
+    while not engine.is_finished() and engine.locked_count < max_pieces:
+        for action in bot.plan(engine):
+            play_action(engine, action)
+        engine.clear_full_rows()
+    return engine
+
+# Plays a number of headless games with the bot and prints a short summary
+def _main():
+    import sys
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    max_pieces = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    lookahead_width = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    bot = Bot(lookahead_width=lookahead_width)
+    scores, pieces, wins = [], 0, 0
+    for seed in range(n_games):
+        engine = play_bot_game(bot, max_pieces=max_pieces, seed=seed)
+        scores.append(engine.score)
+        pieces += engine.locked_count
+        wins += engine.won
+    print("games: %d, pieces: %d, wins: %d, mean score: %.1f, %.2f ms per piece"
+          % (n_games, pieces, wins, sum(scores) / n_games,
+             bot.decision_time / bot.decision_count * 1000))
+    print("transposition table: %(used)d/%(size)d entries, hit rate %(hit_rate).1f%%"
+          % dict(bot.table.stats(), hit_rate=bot.table.stats()["hit_rate"] * 100))
+
+if __name__ == '__main__':
+    _main()
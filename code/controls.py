@@ -0,0 +1,82 @@
+################################################################################
+#                                                                              #
+# The keyboard controls of Tetris 2048 (held keys repeat with DAS and ARR)     #
+#                                                                              #
+################################################################################
+
+from collections import deque  # the queue of the actions to be applied
+
+# the keys that repeat while they are held down (moving and soft dropping)
+REPEATING_KEYS = ("left", "right", "down")
+
+# A class that turns the timestamped key events of stddraw into the actions
+# applied by the game loop. A held key acts once when it is pressed, once more
+# after the delayed auto shift (das seconds) and then every arr seconds (auto
+# repeat rate) until it is released.
+class Controls:
+    # A constructor for creating the controls with the given DAS and ARR values
+    # (in seconds)
+    def __init__(self, das=0.17, arr=0.05, repeating_keys=REPEATING_KEYS):
+        self.das = das
+        self.arr = arr
+        self.repeating_keys = repeating_keys
+        # the time of the next repeat of each held repeating key
+        self.held_keys = {}
+        # the (key, time) actions waiting to be applied, where time is the
+        # time of the key event (or the repeat) that caused the action
+        self.actions = deque()
+        # the number, the total and the maximum of the input latencies (the
+        # times from the key events to the application of their actions)
+        self.latency_count, self.latency_total, self.latency_max = 0, 0.0, 0.0
+
+    # Adds the actions of the given (time, kind, key) key events and of the
+    # repeats of the held keys until now. The held keys do not repeat when
+    # repeat is False (their repeats start again one ARR later). After a stall
+    # of the game loop (more than DAS seconds past the next repeat) a held key
+    # repeats once and its repeats start again one ARR later, instead of
+    # catching up with a burst of the missed repeats.
+    def update(self, key_events, now, repeat=True):
+        for event_time, kind, key in key_events:
+            if kind == "down":
+                self.actions.append((key, event_time))
+                if key in self.repeating_keys:
+                    self.held_keys[key] = event_time + self.das
+            else:  # kind == "up"
+                self.held_keys.pop(key, None)
+        for key, repeat_time in self.held_keys.items():
+            if not repeat:
+                self.held_keys[key] = max(repeat_time, now + self.arr)
+                continue
+            if now - repeat_time > self.das:
+                self.actions.append((key, now))
+                repeat_time = now + self.arr
+            while repeat_time <= now:
+                self.actions.append((key, repeat_time))
+                repeat_time += self.arr
+            self.held_keys[key] = repeat_time
+
+    # Forgets the held keys and the actions that are not applied yet (e.g. when
+    # the game is reset)
+    def clear(self):
+        self.held_keys.clear()
+        self.actions.clear()
+
+    # Returns True if there is an action waiting to be applied
+    def has_next_action(self):
+        return len(self.actions) > 0
+
+    # Removes and returns the key of the oldest action and records its latency
+    # as the time from its event to now
+    def next_action(self, now):
+        key, event_time = self.actions.popleft()
+        latency = max(0.0, now - event_time)
+        self.latency_count += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        return key
+
+    # Returns the number of the applied actions and their mean and maximum
+    # input latencies (in seconds)
+    def latency_stats(self):
+        mean = self.latency_total / self.latency_count if self.latency_count else 0.0
+        return {"count": self.latency_count, "mean": mean, "max": self.latency_max}
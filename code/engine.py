@@ -0,0 +1,241 @@
+################################################################################
+#                                                                              #
+# The headless game engine of Tetris 2048 (no pygame/stddraw import at all)    #
+#                                                                              #
+################################################################################
+
+from board import Board  # the game rules of the grid (without any drawing)
+from tetromino import Tetromino  # the class for modeling the tetrominoes
+from pieces import PieceGenerator, UNIFORM  # the seeded piece generator
+import random  # used for the random moves of the headless simulations
+import time  # used for timing the headless simulations
+
+# the tile number that wins the game when it is created by a merge
+WINNING_NUMBER = 2048
+
+# A class that plays the game (spawn, move, rotate, lock, merge cascade, line
+# clear and scoring) on a grid without drawing anything. The front-end in
+# Tetris_2048.py passes GameGrid as grid_class to get a drawable grid.
+class Engine:
+    # A constructor for creating a new game on a grid with the given size (the
+    # game is reproduced by giving the same seed and piece mode, see
+    # PieceGenerator)
+    def __init__(self, grid_h=20, grid_w=12, grid_class=Board, seed=None,
+                 piece_mode=UNIFORM):
+        self.grid_height = grid_h
+        self.grid_width = grid_w
+        # set the game grid dimension values stored and used in the Tetromino class
+        Tetromino.grid_height = grid_h
+        Tetromino.grid_width = grid_w
+        # create the game grid
+        self.grid = grid_class(grid_h, grid_w)
+        self.score = 0
+        # the rows found full by the last lock (removed by clear_full_rows)
+        self.full_rows = []
+        # the (row, col, new_number) merges done by the last lock and their
+        # number (used for the sounds)
+        self.merge_events = []
+        self.merge_count = 0
+        # the number of tetrominoes locked on the grid so far
+        self.locked_count = 0
+        # the game ends either with a loss (game_over) or with a win (won)
+        self.game_over = False
+        self.won = False
+        # the generator of the types, the spawn columns and the tile numbers of
+        # the tetrominoes of this game
+        self.generator = PieceGenerator(grid_w, seed, piece_mode)
+        self.seed = self.generator.seed
+        # create the first tetromino to enter the game grid (and the second one
+        # so it can be displayed as the next tetromino)
+        self.tetromino_list = [self.generator.create_tetromino(),
+                               self.generator.create_tetromino()]
+        self.grid.current_tetromino = self.tetromino_list[0]
+        # the recorder of the actions and the events of this game (e.g. a
+        # replay.ReplayRecorder), no game is recorded when it is None
+        self.recorder = None
+
+    # Restores the state of a game after the given number of locked pieces
+    # from the cells of its grid (see Board.snapshot) and its score, e.g. from
+    # a replay keyframe. The pieces are the ones the generator of this game
+    # deals after that many pieces, so this engine must have the same seed and
+    # piece mode, and there must be no full rows in the cells.
+    def restore(self, cells, score, locked_count):
+        generator = self.generator
+        self.generator = PieceGenerator(self.grid_width, generator.seed, generator.mode)
+        # skipping a piece only draws its random numbers (nothing is simulated)
+        for _ in range(locked_count):
+            self.generator.next_piece()
+        self.tetromino_list = [self.generator.create_tetromino(),
+                               self.generator.create_tetromino()]
+        self.grid.restore(cells)
+        self.grid.current_tetromino = self.tetromino_list[0]
+        self.score = score
+        self.locked_count = locked_count
+        self.full_rows = []
+        self.merge_events = []
+        self.merge_count = 0
+        self.game_over = False
+        self.won = False
+
+    # Records the given action (see replay.ACTIONS) when the game is recorded
+    def record(self, action):
+        if self.recorder is not None:
+            self.recorder.record_action(action)
+
+    # The tetromino that is currently being moved on the game grid
+    @property
+    def current_tetromino(self):
+        return self.tetromino_list[0]
+
+    # The tetromino that will enter the game grid after the current one
+    @property
+    def next_tetromino(self):
+        return self.tetromino_list[1]
+
+    # Returns True when the game has ended with a loss or a win
+    def is_finished(self):
+        return self.game_over or self.won
+
+    # Moves the current tetromino by 1 in the given direction (left, right or
+    # down) and returns whether it has moved
+    def move(self, direction):
+        if self.is_finished():
+            return False
+        self.record(direction)
+        return self.current_tetromino.move(direction, self.grid)
+
+    # Rotates the current tetromino and returns whether it has rotated
+    def rotate(self):
+        if self.is_finished():
+            return False
+        self.record("rotate")
+        return self.current_tetromino.rotate(self.grid)
+
+    # Drops the current tetromino as far as it goes and locks it on the grid
+    def hard_drop(self):
+        if self.is_finished():
+            return False
+        self.record("drop")
+        tetromino = self.current_tetromino
+        tetromino.bottom_left_cell = tetromino.get_landing_position(self.grid)
+        self.lock()
+        if self.recorder is not None:
+            self.recorder.record_lock(self)
+        return True
+
+    # Moves the current tetromino down by one (auto fall) and locks it when it
+    # cannot go down anymore. Returns True when the tetromino has been locked.
+    def step(self):
+        if self.is_finished():
+            return False
+        self.record("step")
+        if self.current_tetromino.move("down", self.grid):
+            return False
+        self.lock()
+        if self.recorder is not None:
+            self.recorder.record_lock(self)
+        return True
+
+    # Locks the current tetromino on the grid, merges the tiles until there is
+    # nothing left to merge, finds the full rows and spawns the next tetromino
+    def lock(self):
+        self.merge_events = []
+        self.merge_count = 0
+        self.locked_count += 1
+        # the cells of the tiles of the landed tetromino
+        locked_cells = [(row, col) for row, col, tile
+                        in self.current_tetromino.get_tile_positions()]
+        # update the game grid by locking the tiles of the landed tetromino
+        # if the lock method returns true, the game is over
+        if self.grid.lock_tetromino(self.current_tetromino):
+            self.game_over = True
+            return
+        # merge the tiles (and drop the floating clumps) starting from the
+        # columns of the locked tiles until there is nothing left to merge
+        self.merge_events, merge_score = self.grid.merge_cascade(locked_cells)
+        self.merge_count = len(self.merge_events)
+        self.score += merge_score
+        if any(number == WINNING_NUMBER for row, col, number in self.merge_events):
+            self.won = True
+            return
+        self.full_rows = self.grid.find_full_rows()
+        # the next tetromino enters the game grid and a new one is created
+        self.tetromino_list = [self.tetromino_list[1],
+                               self.generator.create_tetromino()]
+        self.grid.current_tetromino = self.tetromino_list[0]
+
+    # Removes the full rows found by the last lock, adds their scores and
+    # returns the score gained
+    def clear_full_rows(self):
+        if not self.full_rows:
+            return 0
+        gained = self.grid.sum_scores_in_row(self.full_rows)
+        self.score += gained
+        self.grid.remove_full_rows(self.full_rows)
+        self.full_rows = []
+        if self.recorder is not None:
+            self.recorder.record_clear(self)
+        return gained
+
+# A function that plays a game with random moves until it ends (or until
+# max_pieces tetrominoes are locked) and returns the engine of the game (the
+# same seed plays the same game). The given function (when any) is called with
+# the engine after each lock, before the full rows are removed.
+def play_random_game(grid_h=20, grid_w=12, max_pieces=1000, seed=None,
+                     after_lock=None):
+    engine = Engine(grid_h, grid_w, seed=seed)
+    moves = random.Random(engine.seed)
+    actions = ["left", "right", "down", "rotate", None]
+    while not engine.is_finished() and engine.locked_count < max_pieces:
+        action = moves.choice(actions)
+        if action == "rotate":
+            engine.rotate()
+        elif action is not None:
+            engine.move(action)
+        if engine.step():
+            if after_lock is not None:
+                after_lock(engine)
+            engine.clear_full_rows()
+    return engine
+
+# Plays the given number of random games (with the seeds 0, 1, ...) and returns
+# the (seed, locked count) of each lock after which the grid is not settled: a
+# tile can merge with the tile above it or a tile is floating. The merge
+# cascade of a lock must settle the whole grid, also the tiles moved by the
+# full rows removed before the lock.
+def check_random_games(n_games=300):
+    unsettled = []
+    for seed in range(n_games):
+        def check(engine):
+            grid = engine.grid
+            if not engine.is_finished() and (grid.check_merge() or
+                                             grid.get_list_of_clumps()):
+                unsettled.append((seed, engine.locked_count))
+        play_random_game(seed=seed, after_lock=check)
+    return unsettled
+
+# Runs a number of random headless games and prints a short summary, or with
+# the argument "check" (and the number of the games) checks that every lock
+# settles the grid (see check_random_games)
+def _main():
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        n_games = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+        unsettled = check_random_games(n_games)
+        for seed, locked_count in unsettled[:10]:
+            print("seed %d: the grid is not settled after lock %d" % (seed, locked_count))
+        print("games: %d, unsettled locks: %d" % (n_games, len(unsettled)))
+        sys.exit(1 if unsettled else 0)
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    start_time = time.perf_counter()
+    scores, pieces = [], 0
+    for _ in range(n_games):
+        engine = play_random_game()
+        scores.append(engine.score)
+        pieces += engine.locked_count
+    elapsed = time.perf_counter() - start_time
+    print("games: %d, pieces: %d, mean score: %.1f, time: %.2f s (%.0f pieces/s)"
+          % (n_games, pieces, sum(scores) / n_games, elapsed, pieces / elapsed))
+
+if __name__ == '__main__':
+    _main()
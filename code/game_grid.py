@@ -1,30 +1,22 @@
 import lib.stddraw as stddraw  # used for displaying the game grid
-from lib.color import Color, COLOR_DICT, WHITE  # used for coloring the game grid
+from lib.color import Color  # used for coloring the game grid
 from point import Point  # used for tile positions
+from board import Board  # the game rules of the grid (without any drawing)
 import numpy as np  # fundamental Python module for scientific computing
-import copy
 import os
-from lib.picture import Picture
+from lib.picture import cachedPicture  # used for drawing the (cached) images
+
+# A class for modeling the game grid (the drawing part on top of the Board rules)
+class GameGrid(Board):
+    # the layers drawn once (see update_layers) and the (scale version of
+    # stddraw, grid height, grid width) they are drawn for (shared by all the
+    # game grids, so a reset does not draw them again)
+    _lines_layer, _panel_layer, _layers_key = None, None, None
 
-# A class for modeling the game grid
-class GameGrid:
     # A constructor for creating the game grid based on the given arguments
     def __init__(self, grid_h, grid_w):
-        # set the dimensions of the game grid as the given arguments
-        self.grid_height = grid_h
-        self.grid_width = grid_w
-
-        # Contains all tile locations that touches to the ground
-        self.bottom_boundries = set()
-        for i in range(self.grid_width):
-            self.bottom_boundries.add((0, i))
-
-        # create a tile matrix to store the tiles locked on the game grid
-        self.tile_matrix = np.full((grid_h, grid_w), None)
-        # create the tetromino that is currently being moved on the game grid
-        self.current_tetromino = None
-        # the game_over flag shows whether the game is over or not
-        self.game_over = False
+        # create the tile matrix and the state used by the game rules
+        super().__init__(grid_h, grid_w)
         # set the color used for the empty grid cells
         self.empty_cell_color = Color(203, 191, 177)
         # set the colors used for the grid lines and the grid boundaries
@@ -33,9 +25,85 @@ class GameGrid:
         # thickness values used for the grid lines and the grid boundaries
         self.line_thickness = 0.003
         self.box_thickness = self.line_thickness
-
-    # A method for displaying the game grid
+        # set the color used for the ghost piece (the landing position of the
+        # current tetromino)
+        self.ghost_color = Color(182, 169, 155)
+        # the looks of the grid cells and the state of the info panel on the
+        # last displayed frame (None draws the whole next frame)
+        self.last_cell_looks, self.last_panel_state = None, None
+
+    # A method for displaying the game grid (only the regions that have changed
+    # since the last frame are drawn again and shown)
     def display(self, score, paused, muted, delay=250, next_=None):
+        # draw the layers that do not change during the game when they are
+        # not drawn yet (or the canvas has changed)
+        layers_key = GameGrid._layers_key
+        self.update_layers()
+        cell_looks = self.get_cell_looks()
+        panel_state = (score, paused, muted, self.get_next_looks(next_))
+        if self.last_cell_looks is None or layers_key != GameGrid._layers_key:
+            self.draw_frame(score, paused, muted, next_)
+            stddraw.show(delay)
+        else:
+            regions = []
+            # the cells that look different (and the cells covered by their
+            # tiles as the tiles are drawn a bit to the right and down)
+            changed = cell_looks != self.last_cell_looks
+            changed[:, 1:] |= changed[:, :-1]
+            changed[:-1, :] |= changed[1:, :]
+            for rows, cols in self.get_changed_boxes(changed):
+                regions.append(self.draw_grid_region(rows, cols))
+            if panel_state != self.last_panel_state:
+                regions.append(self.draw_panel_region(score, paused, muted, next_))
+            # nothing is drawn or shown when nothing has changed (e.g. paused)
+            stddraw.showRegions(regions, delay)
+        self.last_cell_looks, self.last_panel_state = cell_looks, panel_state
+
+    # Returns a matrix with a number for each grid cell that changes whenever
+    # the cell looks different (the exponent of the tile, its highlight, the
+    # ghost piece and the tile of the current tetromino on it)
+    def get_cell_looks(self):
+        looks = self.cells.astype(np.int32)
+        if self.highlighted_rows:
+            looks[sorted(self.highlighted_rows)] |= 1 << 5
+        tetromino = self.current_tetromino
+        if tetromino is not None:
+            landing = tetromino.get_landing_position(self)
+            for dx, dy in tetromino.state.offsets:
+                row, col = landing.y + dy, landing.x + dx
+                if row < self.grid_height:
+                    looks[row, col] |= 1 << 6
+            for row, col, tile in tetromino.get_tile_positions():
+                if row < self.grid_height:
+                    looks[row, col] |= tile.number << 7
+        return looks
+
+    # Returns the numbers on the tiles of the displayed next tetromino
+    def get_next_looks(self, next_):
+        if next_ is None:
+            return None
+        return tuple(tuple(None if tile is None else tile.number for tile in row)
+                     for row in next_)
+
+    # Returns the ((first row, last row), (first col, last col)) boxes of the
+    # changed cells, one for each band of rows with changes (so a moving
+    # tetromino and its ghost piece are drawn as separate regions)
+    def get_changed_boxes(self, changed):
+        boxes = []
+        changed_rows = np.nonzero(changed.any(axis=1))[0]
+        if len(changed_rows) == 0:
+            return boxes
+        # split the changed rows where there are at least 2 unchanged rows
+        splits = np.nonzero(np.diff(changed_rows) > 2)[0] + 1
+        for band in np.split(changed_rows, splits):
+            first_row, last_row = int(band[0]), int(band[-1])
+            band_cols = np.nonzero(changed[first_row:last_row + 1].any(axis=0))[0]
+            boxes.append(((first_row, last_row),
+                          (int(band_cols[0]), int(band_cols[-1]))))
+        return boxes
+
+    # Draws the whole frame (the game grid, the tetrominoes and the info panel)
+    def draw_frame(self, score, paused, muted, next_):
         # clear the background to empty_cell_color
         stddraw.clear(self.empty_cell_color)
         # draw the game grid
@@ -43,6 +111,8 @@ class GameGrid:
         # draw the current/active tetromino if it is not None
         # (the case when the game grid is updated)
         if self.current_tetromino is not None:
+            # the ghost piece shows where the tetromino lands when dropped
+            self.draw_ghost_tetromino()
             self.current_tetromino.draw()
         # draw a box around the game grid
         self.draw_boundaries()
@@ -55,32 +125,58 @@ class GameGrid:
         if next_ is not None:
             self.display_next_tetromino(next_)
 
-        # show the resulting drawing with a pause duration = 250 ms
-        stddraw.show(delay)
-
-    # Displays the next tetromino and the text for it (no way)
-    def display_next_tetromino(self, next_):
-        row = 7
-        col = 12 + (4 - len(next_[0])) / 2
-        starting_col = col
-        for i in next_:
-            col = starting_col
-            for j in i:
-                if j is not None:
-                    j.draw(Point(col, row), length=1)
-                col = col + 1
-            row = row - 1
-        
-        stddraw.setPenColor(Color(88, 90, 107))
-        stddraw.filledRectangle(11.5, 8, 4, 1)
-        
-        stddraw.setFontFamily("Sans Serif")
-        stddraw.setFontSize(30)
-        stddraw.setPenColor(Color(208, 210, 227))
-        stddraw.text(13.5, 8.5, "Next Tetromino")
-        
-    # Gets displayed while playing
-    def display_info(self, score):
+    # Draws again the given rows and columns of the game grid (as in draw_frame)
+    # and returns the region drawn
+    def draw_grid_region(self, rows, cols):
+        region = (cols[0] - 0.5, rows[0] - 0.5, cols[1] + 0.5, rows[1] + 0.5)
+        stddraw.setClip(*region)
+        stddraw.clear(self.empty_cell_color)
+        # the tiles in the row above and in the column on the left are drawn
+        # as well as they cover a part of the region
+        self.draw_grid(rows[0], min(rows[1] + 1, self.grid_height - 1),
+                       max(cols[0] - 1, 0), cols[1])
+        if self.current_tetromino is not None:
+            self.draw_ghost_tetromino()
+            self.current_tetromino.draw()
+        self.draw_boundaries()
+        stddraw.setClip()
+        return region
+
+    # Draws again the info panel (as in draw_frame) and returns the region drawn
+    def draw_panel_region(self, score, paused, muted, next_):
+        region = (self.grid_width - 0.5, -0.5, self.grid_width + 3.5,
+                  self.grid_height - 0.5)
+        stddraw.setClip(*region)
+        self.display_info(score)
+        self.display_buttons(paused, muted)
+        if next_ is not None:
+            self.display_next_tetromino(next_)
+        stddraw.setClip()
+        return region
+
+    # Draws the layers that do not change during the game off-screen once for
+    # each canvas configuration (they are blitted by draw_grid and display_info)
+    def update_layers(self):
+        key = (stddraw.scaleVersion(), self.grid_height, self.grid_width)
+        if GameGrid._layers_key == key:
+            return
+        min_y, max_y = -0.5, self.grid_height - 0.5
+        # the grid lines are drawn over the tiles (a layer with a color key
+        # that is not used by the lines)
+        stddraw.beginOffscreen(-0.5, min_y, self.grid_width - 0.5, max_y,
+                               colorKey=stddraw.BLACK)
+        self.render_grid_lines()
+        GameGrid._lines_layer = stddraw.endOffscreen()
+        # the info panel is drawn over the game grid (an opaque layer)
+        stddraw.beginOffscreen(11.5, min_y, 15.5, max_y, False)
+        self.render_info_panel()
+        GameGrid._panel_layer = stddraw.endOffscreen()
+        GameGrid._layers_key = key
+
+    # Draws the static part of the info panel (the box, the logos, the texts,
+    # the home button and the title of the next tetromino) with the drawing
+    # primitives of stddraw
+    def render_info_panel(self):
         # Adds the info box
         info_menu_color = Color(71, 64, 71)
         stddraw.setPenColor(info_menu_color)
@@ -94,42 +190,73 @@ class GameGrid:
         # Logo of the game
         current_dir = os.path.dirname(os.path.realpath(__file__))
         img_file = current_dir + "/images/minilogo.png"
-        stddraw.picture(Picture(img_file), 13.5, 18.8)
+        stddraw.picture(cachedPicture(img_file), 13.5, 18.8)
 
         # Logo of MEF
         img_file = current_dir + "/images/meflogo.png"
-        stddraw.picture(Picture(img_file), 13.5, 1)
+        stddraw.picture(cachedPicture(img_file), 13.5, 1)
 
-        # Adds the score text
+        # Adds the score title and the help texts
         stddraw.setFontFamily("Helvetica")
         stddraw.setFontSize(35)
         stddraw.setPenColor(Color(208, 210, 227))
-        text_to_display = "SCORE"
-        stddraw.text(13.5, 15, text_to_display)
-        text_to_display = str(score)
-        stddraw.text(13.5, 14, text_to_display)
+        stddraw.text(13.5, 15, "SCORE")
         stddraw.setFontSize(14)
         stddraw.text(13.5, 13.2, "Press \"r\" to reset the game!")
         stddraw.text(13.5, 12.7, "Press \"h\" to hard drop!")
 
+        # Home button
+        img_file = current_dir + "/images/mainmenu.png"
+        stddraw.picture(cachedPicture(img_file), 13.5, 16.25)
+
+        # The title of the next tetromino
+        stddraw.setPenColor(Color(88, 90, 107))
+        stddraw.filledRectangle(11.5, 8, 4, 1)
+        stddraw.setFontFamily("Sans Serif")
+        stddraw.setFontSize(30)
+        stddraw.setPenColor(Color(208, 210, 227))
+        stddraw.text(13.5, 8.5, "Next Tetromino")
+
         # Resets the pencil
         stddraw.setPenRadius()
 
-    # Displays buttons (duh...)
+    # Displays the next tetromino (its title is on the info panel layer)
+    def display_next_tetromino(self, next_):
+        row = 7
+        col = 12 + (4 - len(next_[0])) / 2
+        starting_col = col
+        for i in next_:
+            col = starting_col
+            for j in i:
+                if j is not None:
+                    j.draw(Point(col, row), length=1)
+                col = col + 1
+            row = row - 1
+
+    # Gets displayed while playing
+    def display_info(self, score):
+        # Adds the info panel (drawn once by update_layers)
+        stddraw.blitOffscreen(GameGrid._panel_layer, 11.5, self.grid_height - 0.5)
+        # Adds the score text
+        stddraw.setFontFamily("Helvetica")
+        stddraw.setFontSize(35)
+        stddraw.setPenColor(Color(208, 210, 227))
+        text_to_display = str(score)
+        stddraw.text(13.5, 14, text_to_display)
+
+    # Displays buttons (duh...) (the home button is on the info panel layer)
     def display_buttons(self, paused, muted):
         current_dir = os.path.dirname(os.path.realpath(__file__))
-        img_file = current_dir + "/images/mainmenu.png"
-        stddraw.picture(Picture(img_file), 13.5, 16.25)
         if paused:
             img_file = current_dir + "/images/continue.png"
         else:
             img_file = current_dir + "/images/pause.png"
-        stddraw.picture(Picture(img_file), 12.5, 17.5)
+        stddraw.picture(cachedPicture(img_file), 12.5, 17.5)
         if muted:
             img_file = current_dir + "/images/muted.png"
         else:
             img_file = current_dir + "/images/unmuted.png"
-        stddraw.picture(Picture(img_file), 14.5, 17.5)
+        stddraw.picture(cachedPicture(img_file), 14.5, 17.5)
 
     # Displays Game Over Screen
     def display_end_screen(self, score, is_loss=False):
@@ -138,7 +265,7 @@ class GameGrid:
             img_file = current_dir + "/images/lost.png"
         else:
             img_file = current_dir + "/images/win.png"
-        stddraw.picture(Picture(img_file), 7.5, 9.5)
+        stddraw.picture(cachedPicture(img_file), 7.5, 9.5)
 
         # Display Score
         stddraw.setFontFamily("Impact")
@@ -153,10 +280,13 @@ class GameGrid:
         button_location = (self.grid_width / 2 + 1, self.grid_height / 2 - 3)
         img_file = current_dir + "/images/mainmenu.png"
         stddraw.filledRectangle(button_location[0], button_location[1], 1, 1)
-        stddraw.picture(Picture(img_file),button_location[0] + 0.5 , button_location[1] + 0.5)
+        stddraw.picture(cachedPicture(img_file),button_location[0] + 0.5 , button_location[1] + 0.5)
         
+        # show the end screen once and wait (without using the CPU) until the
+        # user does something
+        stddraw.show(0)
         while True:
-            stddraw.show(50)
+            stddraw.waitForEvent()
             if stddraw.mousePressed():
                 mouse_x, mouse_y = stddraw.mouseX(), stddraw.mouseY()
                 if mouse_x > button_location[0] and mouse_x < (button_location[0] + 1):
@@ -166,15 +296,22 @@ class GameGrid:
                 
 
     # A method for drawing the cells and the lines of the game grid
-    def draw_grid(self):
-        # for each cell of the game grid
-        for row in range(self.grid_height):
-            for col in range(self.grid_width):
-                # if the current grid cell is occupied by a tile
-                if self.tile_matrix[row][col] is not None:
-                    # draw this tile
-                    self.tile_matrix[row][col].draw(Point(col, row))
-        # draw the inner lines of the game grid
+    # (only the tiles in the given rows and columns when they are given)
+    def draw_grid(self, first_row=0, last_row=None, first_col=0, last_col=None):
+        if last_row is None:
+            last_row, last_col = self.grid_height - 1, self.grid_width - 1
+        cells = self.cells[first_row:last_row + 1, first_col:last_col + 1]
+        # for each grid cell that is occupied by a tile
+        for row, col in zip(*np.nonzero(cells)):
+            # draw this tile
+            self.get_tile(first_row + row, first_col + col).draw(
+                Point(first_col + col, first_row + row))
+        # draw the inner lines of the game grid (drawn once by update_layers)
+        stddraw.blitOffscreen(GameGrid._lines_layer, -0.5, self.grid_height - 0.5)
+
+    # A method for drawing the inner lines of the game grid with the drawing
+    # primitives of stddraw
+    def render_grid_lines(self):
         stddraw.setPenColor(self.line_color)
         stddraw.setPenRadius(self.line_thickness)
         # x and y ranges for the game grid
@@ -186,6 +323,17 @@ class GameGrid:
             stddraw.line(start_x, y, end_x, y)
         stddraw.setPenRadius()  # reset the pen radius to its default value
 
+    # A method for drawing the cells where the current tetromino lands when it
+    # is dropped (the landing position comes from the column heights)
+    def draw_ghost_tetromino(self):
+        tetromino = self.current_tetromino
+        landing = tetromino.get_landing_position(self)
+        stddraw.setPenColor(self.ghost_color)
+        for dx, dy in tetromino.state.offsets:
+            row, col = landing.y + dy, landing.x + dx
+            if row < self.grid_height:
+                stddraw.filledSquare(col + 0.04, row - 0.03, 0.5)
+
     # A method for drawing the boundaries around the game grid
     def draw_boundaries(self):
         # draw a bounding box around the game grid as a rectangle
@@ -197,166 +345,3 @@ class GameGrid:
         pos_x, pos_y = -0.5, -0.5
         stddraw.rectangle(pos_x, pos_y, self.grid_width, self.grid_height)
         stddraw.setPenRadius()  # reset the pen radius to its default value
-
-    # A method used checking whether the grid cell with the given row and column
-    # indexes is occupied by a tile or not (i.e., empty)
-    def is_occupied(self, row, col):
-        # considering the newly entered tetrominoes to the game grid that may
-        # have tiles with position.y >= grid_height
-        if not self.is_inside(row, col):
-            return False  # the cell is not occupied as it is outside the grid
-        # the cell is occupied by a tile if it is not None
-        return self.tile_matrix[row][col] is not None
-
-    # A method for checking whether the cell with the given row and col indexes
-    # is inside the game grid or not
-    def is_inside(self, row, col):
-        if row < 0 or row >= self.grid_height:
-            return False
-        if col < 0 or col >= self.grid_width:
-            return False
-        return True
-
-    # A method that locks the tiles of a landed tetromino on the grid checking
-    # if the game is over due to having any tile above the topmost grid row.
-    # (This method returns True when the game is over and False otherwise.)
-    def update_grid(self, tiles_to_lock, blc_position):
-        # necessary for the display method to stop displaying the tetromino
-        self.current_tetromino = None
-        # lock the tiles of the current tetromino (tiles_to_lock) on the grid
-        n_rows, n_cols = len(tiles_to_lock), len(tiles_to_lock[0])
-        for col in range(n_cols):
-            for row in range(n_rows):
-                # place each tile (occupied cell) onto the game grid
-                if tiles_to_lock[row][col] is not None:
-                    # compute the position of the tile on the game grid
-                    pos = Point()
-                    pos.x = blc_position.x + col
-                    pos.y = blc_position.y + (n_rows - 1) - row
-                    # Check if the tile is inside the grid
-                    if self.is_inside(pos.y, pos.x):
-                        self.tile_matrix[pos.y][pos.x] = tiles_to_lock[row][col]
-                    # If the tile is above the grid, end the game
-                    elif pos.y >= self.grid_height:
-                        self.game_over = True
-                        return True  # Immediately return to stop further processing
-        # return the value of the game_over flag
-        return self.game_over
-
-    # Checks if there are the same tiles on top of each other
-    # if it finds any, adds coordinates of both tiles to the list which is then returned
-    def check_merge(self):
-        n_rows, n_cols = self.grid_height, self.grid_width
-        merges = []
-
-        for col in range(n_cols):
-            prev = None
-            for row in range(n_rows):
-                curr = self.tile_matrix[row][col]
-                if (prev is not None and curr is not None
-                        and curr.number == prev):
-                    merges.append((row - 1, col))
-                    merges.append((row, col))
-                    break
-                if curr is not None:
-                    prev = curr.number
-                else:
-                    prev = None
-
-        return merges
-
-    # Merges two tiles (upper one is removed, lower one is doubled)
-    def merge_tiles(self, row, col):
-        cell = self.tile_matrix[row][col]
-        if cell is not None:
-            cell.number = cell.number * 2
-            cell.background_color = COLOR_DICT[cell.number][0]
-            cell.foreground_color = COLOR_DICT[cell.number][1]
-            if row + 1 < self.grid_height:  # Ensure row + 1 is within bounds
-                self.tile_matrix[row + 1][col] = None
-            self.fall_after_merge(row, col)
-        return cell.number
-    # Moves the column above the tiles after a merge
-    def fall_after_merge(self, row, col):
-        current_row = row + 2
-        while current_row < self.grid_height:
-            current_tile = self.tile_matrix[current_row][col]
-            if current_tile is None:
-                break
-            # Move the tile down
-            self.tile_matrix[current_row][col] = None
-            self.tile_matrix[current_row - 1][col] = current_tile
-            current_row += 1
-
-    # Returns a list of connected tile locations starting from a location
-    def get_connected_tiles(self, starting_location, tile_set, check_set):
-        row, col = starting_location
-        if self.is_occupied(row, col) and starting_location not in check_set:
-            tile_set.add(starting_location)
-            check_set.add(starting_location)
-            if (row + 1, col) not in check_set:
-                self.get_connected_tiles((row + 1, col), tile_set, check_set)
-            if (row - 1, col) not in check_set:
-                self.get_connected_tiles((row - 1, col), tile_set, check_set)
-            if (row, col + 1) not in check_set:
-                self.get_connected_tiles((row, col + 1), tile_set, check_set)
-            if (row, col - 1) not in check_set:
-                self.get_connected_tiles((row, col - 1), tile_set, check_set)
-    # Applies get_connected_tiles to (almost) all tiles and returns a complete list of floating clumps (set of not connected tiles)
-    def get_list_of_clumps(self):
-        checked_tiles = set()
-        total_clumps = []
-        for i in range(1, self.grid_height):
-            for j in range(self.grid_width):
-                temp_set = set()
-                self.get_connected_tiles((i, j), temp_set, checked_tiles)
-                if temp_set and not temp_set & self.bottom_boundries:
-                    total_clumps.append(temp_set)
-        return total_clumps
-    # Moves all the floating clumps down until at least one is connected
-    def drop_the_clumps(self):
-        temp_list = self.get_list_of_clumps()
-        while temp_list:
-            for i in temp_list:
-                for j in i:
-                    current_tile = copy.deepcopy(self.tile_matrix[j[0]][j[1]])
-                    self.tile_matrix[j[0]][j[1]] = None
-                    self.tile_matrix[j[0] - 1][j[1]] = current_tile
-            temp_list = self.get_list_of_clumps()
-
-    # Finds full rows, changes their color and returns row indexes
-    def find_full_rows(self):
-        n_rows, n_cols = self.grid_height, self.grid_width
-        rows = []
-        for i in range(n_rows):
-            is_full = True
-            for j in range(n_cols):
-                if self.tile_matrix[i][j] is None:
-                    is_full = False
-                    break
-            if is_full:
-                rows.append(i)
-                for j in range(0, n_cols):
-                    tile = self.tile_matrix[i][j]
-                    tile.background_color = Color(79, 255, 0)
-                    tile.foreground_color = WHITE
-        return rows
-
-    # Moves tiles above the rows that should be deleted one step down
-    def remove_full_rows(self, rows):
-        n_rows, n_cols = self.grid_height, self.grid_width
-
-        for i in rows:
-            for k in range(i, n_rows - 1):
-                for j in range(n_cols):
-                    self.tile_matrix[k][j] = self.tile_matrix[k + 1][j]
-
-    # Sums values of tiles in full rows
-    def sum_scores_in_row(self, rows):
-        cols = self.grid_width
-        sum = 0
-        for i in rows:
-            for j in range(cols):
-                if self.tile_matrix[i][j] is not None:
-                    sum += self.tile_matrix[i][j].number
-        return sum
@@ -107,6 +107,14 @@ COLOR_DICT = {
     2048: (Color(237, 194, 45), WHITE)
 }
 
+# The tile colors of COLOR_DICT keyed by the exponent of the tile number
+# (EXPONENT_COLORS[e] is the (background, foreground) pair of the number 2**e,
+# index 0 is the empty cell)
+EXPONENT_COLORS = [None] + [COLOR_DICT[2 ** e] for e in range(1, 12)]
+
+# The colors of the tiles in a full row (shown before the row is removed)
+FULL_ROW_COLORS = (Color(79, 255, 0), WHITE)
+
 #-----------------------------------------------------------------------
 
 def _main():
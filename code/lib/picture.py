@@ -98,3 +98,44 @@ class Picture:
         """
         pygameColor = pygame.Color(c.getRed(), c.getGreen(), c.getBlue(), 0)
         self._surface.set_at((x, y), pygameColor)
+
+#-----------------------------------------------------------------------
+
+# The pictures read by cachedPicture() keyed by their file names, and
+# the file names whose pictures are converted to the display format.
+_pictureCache = {}
+_convertedFiles = set()
+
+def cachedPicture(fileName):
+    """
+    Return the Picture read from the file whose name is fileName.
+    The file is read only once, later calls return the same Picture
+    object (so it must not be modified). When the display window
+    exists, the image is converted to the pixel format of the display
+    (with per-pixel alpha) so that it is drawn faster.
+    """
+    pic = _pictureCache.get(fileName)
+    if pic is None:
+        pic = Picture(fileName)
+        _pictureCache[fileName] = pic
+    if (fileName not in _convertedFiles) and \
+        (pygame.display.get_surface() is not None):
+        pic._surface = pic._surface.convert_alpha()
+        _convertedFiles.add(fileName)
+    return pic
+
+def preloadPictures(fileNames):
+    """
+    Read (and convert, see cachedPicture()) the pictures in the files
+    whose names are in fileNames, so that drawing them later does not
+    read any file.
+    """
+    for fileName in fileNames:
+        cachedPicture(fileName)
+
+def clearPictureCache():
+    """
+    Remove all the pictures from the cache of cachedPicture().
+    """
+    _pictureCache.clear()
+    _convertedFiles.clear()
@@ -10,15 +10,16 @@ commonly used Color objects defined in the color module.
 import time
 import os
 import sys
+import math
+import collections
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
 import pygame
 import pygame.gfxdraw
 import pygame.font
 
-import tkinter as Tkinter
-import tkinter.messagebox as tkMessageBox
-import tkinter.filedialog as tkFileDialog
+# tkinter is imported only by the functions that display the dialog
+# boxes (in child processes), so importing stddraw does not import it.
 	
 #-----------------------------------------------------------------------
 
@@ -82,6 +83,7 @@ _DEFAULT_PEN_COLOR = BLACK
 
 _DEFAULT_FONT_FAMILY = 'Helvetica'
 _DEFAULT_FONT_SIZE = 12
+_DEFAULT_TEXT_CACHE_SIZE = 512
 
 _xmin = None
 _ymin = None
@@ -95,11 +97,37 @@ _canvasWidth = float(_DEFAULT_CANVAS_SIZE)
 _canvasHeight = float(_DEFAULT_CANVAS_SIZE)
 _penRadius = None
 _penColor = _DEFAULT_PEN_COLOR
-_keysTyped = []
+_keysTyped = collections.deque()
+
+# The key events as (time, kind, key) tuples in the order they occurred,
+# where time is the time.monotonic() time at which the event was
+# received, kind is 'down' or 'up' and key is the name of the key. Only
+# the latest _MAX_KEY_EVENTS events are kept when they are not read.
+_MAX_KEY_EVENTS = 1024
+_keyEvents = collections.deque(maxlen=_MAX_KEY_EVENTS)
+
+# The fonts keyed by (family, size, bold), and the rendered text
+# surfaces keyed by (family, size, bold, string, rgb) in least recently
+# used order (with the hit and miss counts of the text cache).
+_fontCache = {}
+_textCache = collections.OrderedDict()
+_textCacheSize = _DEFAULT_TEXT_CACHE_SIZE
+_textCacheHits = 0
+_textCacheMisses = 0
 
 # Has the window been created?
 _windowCreated = False
 
+# The number of times the canvas size or scale has been set (so that the
+# clients can tell when the surfaces they have drawn off-screen are out
+# of date), the canvas pixel at the upper left corner of the surface
+# drawn on (moved by beginOffscreen()) and the drawing states saved by
+# beginOffscreen().
+_scaleVersion = 0
+_originX = 0
+_originY = 0
+_offscreenStack = []
+
 #-----------------------------------------------------------------------
 # Begin added by Alan J. Broder
 #-----------------------------------------------------------------------
@@ -133,10 +161,10 @@ def _pygameColor(c):
 # Private functions to scale and factor X and Y values.
 
 def _scaleX(x):
-    return _canvasWidth * (x - _xmin) / (_xmax - _xmin)
+    return _canvasWidth * (x - _xmin) / (_xmax - _xmin) - _originX
 
 def _scaleY(y):
-    return _canvasHeight * (_ymax - y) / (_ymax - _ymin)
+    return _canvasHeight * (_ymax - y) / (_ymax - _ymin) - _originY
 
 def _factorX(w):
     return w * _canvasWidth / abs(_xmax - _xmin)
@@ -180,6 +208,7 @@ def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE):
 
     _canvasWidth = w
     _canvasHeight = h
+    _increaseScaleVersion()
     _background = pygame.display.set_mode([w, h])
     pygame.display.set_caption('')
     _surface = pygame.Surface((w, h))
@@ -200,6 +229,7 @@ def setXscale(min=_DEFAULT_XMIN, max=_DEFAULT_XMAX):
     size = max - min
     _xmin = min - _BORDER * size
     _xmax = max + _BORDER * size
+    _increaseScaleVersion()
 
 def setYscale(min=_DEFAULT_YMIN, max=_DEFAULT_YMAX):
     """
@@ -215,6 +245,19 @@ def setYscale(min=_DEFAULT_YMIN, max=_DEFAULT_YMAX):
     size = max - min
     _ymin = min - _BORDER * size
     _ymax = max + _BORDER * size
+    _increaseScaleVersion()
+
+def _increaseScaleVersion():
+    global _scaleVersion
+    _scaleVersion += 1
+
+def scaleVersion():
+    """
+    Return a number that changes whenever the canvas size or the x- or
+    y-scale is set. Surfaces drawn off-screen (see beginOffscreen())
+    with a different scale version are out of date.
+    """
+    return _scaleVersion
 
 def setPenRadius(r=_DEFAULT_PEN_RADIUS):
     """
@@ -480,6 +523,71 @@ def filledPolygon(x, y):
     points.append((xScaled[0], yScaled[0]))
     pygame.draw.polygon(_surface, _pygameColor(_penColor), points, 0)
 
+def _getFont(bold):
+    """
+    Return the font with the current font family and size (bold if
+    bold is True). Each font is created only once.
+    """
+    key = (_fontFamily, _fontSize, bold)
+    font = _fontCache.get(key)
+    if font is None:
+        font = pygame.font.SysFont(_fontFamily, _fontSize, bold)
+        _fontCache[key] = font
+    return font
+
+def _renderText(s, bold):
+    """
+    Return a surface with string s rendered with the current font and
+    pen color. The surfaces are kept in a least recently used cache.
+    """
+    global _textCacheHits
+    global _textCacheMisses
+    rgb = (_penColor.getRed(), _penColor.getGreen(), _penColor.getBlue())
+    key = (_fontFamily, _fontSize, bold, s, rgb)
+    text = _textCache.get(key)
+    if text is not None:
+        _textCacheHits += 1
+        _textCache.move_to_end(key)
+        return text
+    _textCacheMisses += 1
+    text = _getFont(bold).render(s, 1, pygame.Color(*rgb))
+    if _textCacheSize > 0:
+        _textCache[key] = text
+        if len(_textCache) > _textCacheSize:
+            _textCache.popitem(last=False)
+    return text
+
+def setTextCacheSize(n=_DEFAULT_TEXT_CACHE_SIZE):
+    """
+    Set the maximum number of rendered texts kept in the text cache to
+    n (0 disables the cache).
+    """
+    global _textCacheSize
+    if n < 0:
+        raise Exception('Argument to setTextCacheSize() must be non-neg')
+    _textCacheSize = n
+    while len(_textCache) > _textCacheSize:
+        _textCache.popitem(last=False)
+
+def textCacheInfo():
+    """
+    Return the hits, misses, current size and maximum size of the text
+    cache as a dictionary.
+    """
+    return {'hits': _textCacheHits, 'misses': _textCacheMisses,
+            'size': len(_textCache), 'maxSize': _textCacheSize}
+
+def clearTextCache():
+    """
+    Remove all the rendered texts from the text cache and reset its
+    hit and miss counts.
+    """
+    global _textCacheHits
+    global _textCacheMisses
+    _textCache.clear()
+    _textCacheHits = 0
+    _textCacheMisses = 0
+
 def text(x, y, s):
     """
     Draw string s on the background canvas centered at (x, y).
@@ -489,8 +597,7 @@ def text(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    text = _renderText(s, False)
     textpos = text.get_rect(center=(xs, ys))
     _surface.blit(text, textpos)
 
@@ -503,8 +610,7 @@ def boldText(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize, True)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    text = _renderText(s, True)
     textpos = text.get_rect(center=(xs, ys))
     _surface.blit(text, textpos)
 
@@ -530,6 +636,102 @@ def picture(pic, x=None, y=None):
     picSurface = pic._surface # violates encapsulation
     _surface.blit(picSurface, [xs-ws/2.0, ys-hs/2.0, ws, hs])
 
+#-----------------------------------------------------------------------
+
+# Functions to draw off-screen once and copy the result many times.
+
+def _pixelRegion(xmin, ymin, xmax, ymax):
+    """
+    Return the (left, top, right, bottom) pixels of the smallest region
+    of whole pixels that covers the region from (xmin, ymin) to
+    (xmax, ymax).
+    """
+    return (math.floor(_scaleX(xmin)), math.floor(_scaleY(ymax)),
+        math.ceil(_scaleX(xmax)), math.ceil(_scaleY(ymin)))
+
+def _pixelRect(region):
+    """
+    Return the pygame.Rect of the pixels that cover region, which is an
+    (xmin, ymin, xmax, ymax) tuple.
+    """
+    left, top, right, bottom = _pixelRegion(*region)
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+def setClip(xmin=None, ymin=None, xmax=None, ymax=None):
+    """
+    Restrict the drawing on the background canvas to the region from
+    (xmin, ymin) to (xmax, ymax), so that a part of a drawing can be
+    drawn again. Without arguments, remove the restriction.
+    """
+    _makeSureWindowCreated()
+    if xmin is None:
+        _surface.set_clip(None)
+    else:
+        _surface.set_clip(_pixelRect((xmin, ymin, xmax, ymax)))
+
+def beginOffscreen(xmin, ymin, xmax, ymax, transparent=True,
+    colorKey=None):
+    """
+    Redirect the drawing functions to a new surface that covers the
+    region of the canvas from (xmin, ymin) to (xmax, ymax) with the
+    current scale, until endOffscreen() is called. The surface is
+    transparent if transparent is True, otherwise it is opaque (and
+    faster to blit). If colorKey (a color.Color) is given, the surface
+    is filled with colorKey and only its pixels with that color are
+    transparent, which is much faster to blit than a transparent
+    surface (but has no partially transparent pixels).
+    """
+    global _surface
+    global _originX
+    global _originY
+    _makeSureWindowCreated()
+    # Align the region with the pixels of the canvas (by moving the
+    # origin by whole pixels), so that blitting the surface gives the
+    # same pixels as drawing on the canvas.
+    left, top, right, bottom = _pixelRegion(xmin, ymin, xmax, ymax)
+    _offscreenStack.append((_surface, _originX, _originY))
+    _originX += left
+    _originY += top
+    if colorKey is not None:
+        _surface = pygame.Surface((right - left, bottom - top))
+        _surface.fill(_pygameColor(colorKey))
+        _surface.set_colorkey(_pygameColor(colorKey))
+    elif transparent:
+        _surface = pygame.Surface((right - left, bottom - top),
+            pygame.SRCALPHA)
+    else:
+        _surface = pygame.Surface((right - left, bottom - top))
+
+def endOffscreen():
+    """
+    Stop drawing off-screen (see beginOffscreen()) and return the
+    surface drawn on. The surface can be drawn on the canvas by
+    calling blitOffscreen().
+    """
+    global _surface
+    global _originX
+    global _originY
+    if not _offscreenStack:
+        raise Exception('endOffscreen() called without beginOffscreen()')
+    surface = _surface
+    _surface, _originX, _originY = _offscreenStack.pop()
+    # Run-length encode the surfaces with a color key only now that
+    # they are drawn (drawing on an encoded surface changes the
+    # blending of the smooth edges).
+    colorKey = surface.get_colorkey()
+    if colorKey is not None:
+        surface.set_colorkey(colorKey, pygame.RLEACCEL)
+    return surface
+
+def blitOffscreen(surface, xmin, ymax):
+    """
+    Draw on the background canvas a surface returned by endOffscreen()
+    whose region has (xmin, ymax) as its upper left corner.
+    """
+    _makeSureWindowCreated()
+    _surface.blit(surface,
+        (math.floor(_scaleX(xmin)), math.floor(_scaleY(ymax))))
+
 def clear(c=WHITE):
     """
     Clear the background canvas to color c, where c is an
@@ -566,6 +768,34 @@ def _show():
     pygame.display.flip()
     _checkForEvents()
 
+def _showRegions(regions):
+    """
+    Copy the given regions of the background canvas to the window
+    canvas.
+    """
+    rects = [_pixelRect(region) for region in regions]
+    for rect in rects:
+        _background.blit(_surface, rect, rect)
+    if rects:
+        pygame.display.update(rects)
+    _checkForEvents()
+
+def _wait(msec):
+    """
+    Wait for msec milliseconds, but check for events every QUANTUM
+    seconds.
+    """
+    QUANTUM = .01
+    sec = msec / 1000.0
+    if sec < QUANTUM:
+        time.sleep(sec)
+        return
+    secondsWaited = 0.0
+    while secondsWaited < sec:
+        time.sleep(QUANTUM)
+        secondsWaited += QUANTUM
+        _checkForEvents()
+
 def _showAndWaitForever():
     """
     Copy the background canvas to the window canvas. Then wait
@@ -592,16 +822,28 @@ def show(msec=float('inf')):
 
     # Sleep for the required time, but check for events every
     # QUANTUM seconds.
-    QUANTUM = .01
-    sec = msec / 1000.0
-    if sec < QUANTUM:
-        time.sleep(sec)
-        return
-    secondsWaited = 0.0
-    while secondsWaited < sec:
-        time.sleep(QUANTUM)
-        secondsWaited += QUANTUM
-        _checkForEvents()
+    _wait(msec)
+
+def showRegions(regions, msec=0):
+    """
+    Copy only the given regions of the background canvas to the window
+    canvas, and then wait for msec milliseconds. regions is a list of
+    (xmin, ymin, xmax, ymax) tuples. When regions is empty, nothing is
+    copied (the window is not updated at all) and this function just
+    waits.
+    """
+    _makeSureWindowCreated()
+    _showRegions(regions)
+    _wait(msec)
+
+def pollEvents():
+    """
+    Check for the events (such as keys typed and mouse clicks) that
+    have occurred, without copying the background canvas to the window
+    canvas and without waiting.
+    """
+    _makeSureWindowCreated()
+    _checkForEvents()
 
 #-----------------------------------------------------------------------
 
@@ -650,9 +892,15 @@ def _checkForEvents():
     Check if any new event has occured (such as a key typed or button
     pressed).  If a key has been typed, then put that key in a queue.
     """
-    global _surface
-    global _keysTyped
-    
+    _makeSureWindowCreated()
+
+    for event in pygame.event.get():
+        _handleEvent(event)
+
+def _handleEvent(event):
+    """
+    Handle the given event (see _checkForEvents()).
+    """
     #-------------------------------------------------------------------
     # Begin added by Alan J. Broder
     #-------------------------------------------------------------------
@@ -661,30 +909,55 @@ def _checkForEvents():
     #-------------------------------------------------------------------
     # End added by Alan J. Broder
     #-------------------------------------------------------------------
-    
-    _makeSureWindowCreated()
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit()
-        elif event.type == pygame.KEYDOWN:
-            _keysTyped = [pygame.key.name(event.key)] + _keysTyped
-        elif (event.type == pygame.MOUSEBUTTONUP) and \
-            (event.button == 3):
-            _saveToFile()
-            
-        #---------------------------------------------------------------
-        # Begin added by Alan J. Broder
-        #---------------------------------------------------------------
-        # Every time the mouse button is pressed, remember
-        # the mouse position as of that press.
-        elif (event.type == pygame.MOUSEBUTTONDOWN) and \
-            (event.button == 1): 
-            _mousePressed = True
-            _mousePos = event.pos                      
-        #---------------------------------------------------------------
-        # End added by Alan J. Broder
-        #---------------------------------------------------------------
+    if event.type == pygame.QUIT:
+        sys.exit()
+    elif event.type == pygame.KEYDOWN:
+        key = pygame.key.name(event.key)
+        _keysTyped.append(key)
+        _keyEvents.append((time.monotonic(), 'down', key))
+    elif event.type == pygame.KEYUP:
+        _keyEvents.append(
+            (time.monotonic(), 'up', pygame.key.name(event.key)))
+    elif (event.type == pygame.MOUSEBUTTONUP) and \
+        (event.button == 3):
+        _saveToFile()
+    # The window canvas has to be copied to the window again when the
+    # window has been covered (the background canvas is not changed).
+    elif event.type == pygame.WINDOWEXPOSED:
+        pygame.display.flip()
+
+    #-------------------------------------------------------------------
+    # Begin added by Alan J. Broder
+    #-------------------------------------------------------------------
+    # Every time the mouse button is pressed, remember
+    # the mouse position as of that press.
+    elif (event.type == pygame.MOUSEBUTTONDOWN) and \
+        (event.button == 1):
+        _mousePressed = True
+        _mousePos = event.pos
+    #-------------------------------------------------------------------
+    # End added by Alan J. Broder
+    #-------------------------------------------------------------------
+
+def waitForEvent(msec=float('inf')):
+    """
+    Wait until an event occurs (such as a key typed or a mouse click)
+    or msec milliseconds pass, without using the CPU while waiting.
+    msec defaults to infinity. The events are handled as by show().
+    Return True if an event has occurred, and False otherwise.
+    """
+    _makeSureWindowCreated()
+    if msec == float('inf'):
+        event = pygame.event.wait()
+    else:
+        # pygame.event.wait() waits forever when its timeout is 0.
+        event = pygame.event.wait(max(1, int(msec)))
+    if event.type == pygame.NOEVENT:
+        return False
+    _handleEvent(event)
+    _checkForEvents()
+    return True
 
 #-----------------------------------------------------------------------
 
@@ -695,23 +968,42 @@ def hasNextKeyTyped():
     Return True if the queue of the keys the user typed is not empty.
     Otherwise return False.
     """
-    global _keysTyped
-    return _keysTyped != []
+    return len(_keysTyped) > 0
 
 def nextKeyTyped():
     """
     Remove the first key from the queue of the keys that the user typed,
     and return that key.
     """
-    global _keysTyped
-    return _keysTyped.pop()
+    return _keysTyped.popleft()
 
 def clearKeysTyped():
     """
     Clear all the keys in the queue of the keys that the user typed.
     """
-    global _keysTyped
-    _keysTyped = []
+    _keysTyped.clear()
+
+def hasNextKeyEvent():
+    """
+    Return True if the queue of the key events (keys pressed and
+    released) is not empty. Otherwise return False.
+    """
+    return len(_keyEvents) > 0
+
+def nextKeyEvent():
+    """
+    Remove the first (oldest) event from the queue of the key events,
+    and return it as a (time, kind, key) tuple, where time is the
+    time.monotonic() time at which the event was received, kind is
+    'down' or 'up' and key is the name of the key.
+    """
+    return _keyEvents.popleft()
+
+def clearKeyEvents():
+    """
+    Clear all the events in the queue of the key events.
+    """
+    _keyEvents.clear()
 
 #-----------------------------------------------------------------------
 # Begin added by Alan J. Broder
@@ -777,6 +1069,8 @@ def _getFileName():
     """
     Display a dialog box that asks the user for a file name.
     """
+    import tkinter as Tkinter
+    import tkinter.filedialog as tkFileDialog
     root = Tkinter.Tk()
     root.withdraw()
     reply = tkFileDialog.asksaveasfilename(initialdir='.')
@@ -788,6 +1082,8 @@ def _confirmFileSave():
     """
     Display a dialog box that confirms a file save operation.
     """
+    import tkinter as Tkinter
+    import tkinter.messagebox as tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showinfo(title='File Save Confirmation',
@@ -799,6 +1095,8 @@ def _reportFileSaveError(msg):
     Display a dialog box that reports a msg.  msg is a string which
     describes an error in a file save operation.
     """
+    import tkinter as Tkinter
+    import tkinter.messagebox as tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showerror(title='File Save Error', message=msg)
@@ -0,0 +1,83 @@
+################################################################################
+#                                                                              #
+# The seeded piece generator of Tetris 2048 (types, spawn columns and tiles)   #
+#                                                                              #
+################################################################################
+
+import random  # the random number generator of each game (random.Random)
+from collections import deque  # the lookahead queue of the pieces
+from tetromino import Tetromino, SHAPES  # the tetrominoes and their sizes
+
+# the types (shapes) of the tetrominoes used in the game
+TETROMINO_TYPES = ['I', 'O', 'Z', 'J', 'L', 'S', 'T']
+
+# the modes of choosing the tetromino types: "uniform" chooses each type
+# independently, "bag" deals the 7 types in a random order before repeating
+UNIFORM, BAG = "uniform", "bag"
+
+# A class for modeling a piece to be created as its tetromino type, the column
+# of its bottom left cell when it spawns and the numbers on its 4 tiles
+class Piece:
+    def __init__(self, shape, spawn_column, numbers):
+        self.type = shape
+        self.spawn_column = spawn_column
+        self.numbers = numbers
+
+# A class that creates the pieces of a game from its own random number
+# generator, so a game with a given seed (and mode) always gets the same
+# pieces. The pieces are drawn from the generator in order and kept in a
+# queue, so looking ahead does not change the pieces.
+class PieceGenerator:
+    # A constructor for creating a generator for a game grid with the given
+    # width (a random seed is chosen when no seed is given, so every game has a
+    # seed that reproduces it)
+    def __init__(self, grid_width, seed=None, mode=UNIFORM):
+        if mode not in (UNIFORM, BAG):
+            raise ValueError("unknown piece generator mode: %r" % (mode,))
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.grid_width = grid_width
+        self.seed = seed
+        self.mode = mode
+        self.random = random.Random(seed)
+        # the types left in the current bag (bag mode)
+        self.bag = []
+        # the pieces drawn but not created yet (see peek)
+        self.queue = deque()
+        # the number of the pieces created so far
+        self.count = 0
+
+    # Draws the type of the next piece
+    def draw_type(self):
+        if self.mode == UNIFORM:
+            return TETROMINO_TYPES[self.random.randrange(len(TETROMINO_TYPES))]
+        if not self.bag:
+            self.bag = list(TETROMINO_TYPES)
+            self.random.shuffle(self.bag)
+        return self.bag.pop()
+
+    # Draws the next piece (its type, then its spawn column, then the numbers
+    # on its tiles as 2 or 4)
+    def draw_piece(self):
+        shape = self.draw_type()
+        n = SHAPES[shape][0]  # the size of the tile matrix of the type
+        spawn_column = self.random.randint(0, self.grid_width - n)
+        numbers = [self.random.randint(1, 2) * 2 for _ in range(4)]
+        return Piece(shape, spawn_column, numbers)
+
+    # Returns the next n pieces without creating them (the lookahead queue)
+    def peek(self, n=1):
+        while len(self.queue) < n:
+            self.queue.append(self.draw_piece())
+        return list(self.queue)[:n]
+
+    # Returns the next piece and removes it from the lookahead queue
+    def next_piece(self):
+        self.peek(1)
+        self.count += 1
+        return self.queue.popleft()
+
+    # Creates the tetromino of the next piece
+    def create_tetromino(self):
+        piece = self.next_piece()
+        return Tetromino(piece.type, piece.spawn_column, piece.numbers)
@@ -0,0 +1,453 @@
+################################################################################
+#                                                                              #
+# The replay files of Tetris 2048 (recording and reading the played games)     #
+#                                                                              #
+################################################################################
+
+import os  # used for creating the directory of the replay files
+import atexit  # finishing the replay files that are open when the program exits
+import struct  # the fixed size trailer at the end of a replay file
+import threading  # the thread that compresses and writes the replay files
+import queue  # the chunks waiting to be written by the writer thread
+import time  # the timestamps of the records
+import zlib  # the compression of the chunks
+from pieces import UNIFORM, BAG  # the modes of the piece generator
+
+# A replay file starts with a header (the magic bytes, the format version, the
+# grid size, the seed and the mode of the piece generator, the keyframe
+# interval and the time the game was started) followed by the chunks of the
+# records. Each chunk is zlib compressed on its own and starts with a keyframe
+# (the whole grid), so a reader can start reading at any chunk. The chunks end
+# with a zero length, and then come the index of the chunks (for seeking) and
+# a fixed size trailer that points to the index. A file without the index (e.g.
+# when the game crashed) can still be read chunk by chunk from the beginning.
+MAGIC = b"T2048RP"
+VERSION = 2  # 2: the wall kicks follow the SRS (the old replays play differently)
+INDEX_MAGIC = b"T2IX"
+TRAILER = struct.Struct("<Q4s")  # the offset of the index and INDEX_MAGIC
+
+# the kinds of the records: the actions of the engine (the inputs and the
+# gravity steps) and the lock, keyframe and end events
+ACTIONS = ("left", "right", "down", "rotate", "drop", "step", "clear")
+LOCK, KEYFRAME, END = 7, 8, 9
+KINDS = ACTIONS + ("lock", "keyframe", "end")
+
+# the piece generator modes stored in the header
+PIECE_MODES = (UNIFORM, BAG)
+
+# the status of a game stored in the lock and end records
+PLAYING, LOST, WON = 0, 1, 2
+
+# the number of the locked pieces between two keyframes
+KEYFRAME_INTERVAL = 25
+
+# Appends the given non-negative integer to the given bytearray as a varint (7
+# bits per byte starting from the lowest bits, the high bit is set on all the
+# bytes except the last one)
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+# Reads a varint from the given bytes at the given position and returns the
+# value and the position after it
+def read_varint(data, pos):
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+# Maps a signed integer to a non-negative one (0, -1, 1, -2, ... to 0, 1, 2, 3,
+# ...), so a negative seed is also stored as a short varint
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+# Reverses zigzag
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+# Applies the given recorded action (see ACTIONS) to the given engine
+def apply_action(engine, action):
+    if action == "step":
+        engine.step()
+    elif action == "rotate":
+        engine.rotate()
+    elif action == "drop":
+        engine.hard_drop()
+    elif action == "clear":
+        engine.clear_full_rows()
+    else:  # left, right or down
+        engine.move(action)
+
+# Returns the status of the game of the given engine
+def game_status(engine):
+    if engine.game_over:
+        return LOST
+    if engine.won:
+        return WON
+    return PLAYING
+
+# A class for modeling the header of a replay file
+class ReplayHeader:
+    def __init__(self, grid_height, grid_width, seed, piece_mode,
+                 keyframe_interval=KEYFRAME_INTERVAL, start_time=0):
+        self.grid_height = grid_height
+        self.grid_width = grid_width
+        self.seed = seed
+        self.piece_mode = piece_mode
+        self.keyframe_interval = keyframe_interval
+        # the wall clock time (in seconds since the epoch) the game started
+        self.start_time = start_time
+
+    # Returns the bytes of this header
+    def to_bytes(self):
+        buffer = bytearray(MAGIC)
+        buffer.append(VERSION)
+        write_varint(buffer, self.grid_height)
+        write_varint(buffer, self.grid_width)
+        write_varint(buffer, zigzag(self.seed))
+        buffer.append(PIECE_MODES.index(self.piece_mode))
+        write_varint(buffer, self.keyframe_interval)
+        write_varint(buffer, self.start_time)
+        return bytes(buffer)
+
+    # Reads a header from the beginning of the given bytes and returns it with
+    # the position after it
+    @staticmethod
+    def from_bytes(data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a replay file")
+        version = data[len(MAGIC)]
+        if version != VERSION:
+            raise ValueError("unsupported replay version: %d" % version)
+        pos = len(MAGIC) + 1
+        grid_height, pos = read_varint(data, pos)
+        grid_width, pos = read_varint(data, pos)
+        seed, pos = read_varint(data, pos)
+        piece_mode = PIECE_MODES[data[pos]]
+        keyframe_interval, pos = read_varint(data, pos + 1)
+        start_time, pos = read_varint(data, pos)
+        header = ReplayHeader(grid_height, grid_width, unzigzag(seed),
+                              piece_mode, keyframe_interval, start_time)
+        return header, pos
+
+# A class that writes a replay file in its own thread. The chunks are given to
+# the thread through a queue, and the thread compresses them, writes them and
+# keeps their index, so the game loop never waits for the compression or the
+# disk. The thread finishes the file (the index and the trailer) after close.
+# The thread is a daemon, so it never keeps the program running (the files of
+# the games still being recorded are finished at exit, see
+# close_open_recorders).
+class ReplayWriter:
+    # A constructor that starts writing the replay file with the given path
+    # and header (the directory of the file is created when needed)
+    def __init__(self, path, header, level=6):
+        self.path = path
+        self.header = header
+        self.level = level
+        # the (locked count, time, offset) of each chunk written so far
+        self.index = []
+        # the (locked count, time, data) chunks to be written, and None after
+        # the last chunk
+        self.chunks = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Adds the records of a chunk that starts with the keyframe after the
+    # given number of locked pieces at the given time
+    def write_chunk(self, locked_count, time_ms, data):
+        self.chunks.put((locked_count, time_ms, data))
+
+    # Finishes the file after the chunks added so far (without waiting)
+    def close(self):
+        self.chunks.put(None)
+
+    # Waits until the file is finished (at most the given number of seconds
+    # when timeout is not None)
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+
+    # Writes the file (in the writer thread)
+    def run(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "wb") as file:
+                file.write(self.header.to_bytes())
+                while True:
+                    chunk = self.chunks.get()
+                    if chunk is None:
+                        break
+                    locked_count, time_ms, data = chunk
+                    compressed = zlib.compress(data, self.level)
+                    self.index.append((locked_count, time_ms, file.tell()))
+                    frame = bytearray()
+                    write_varint(frame, len(compressed))
+                    file.write(frame)
+                    file.write(compressed)
+                file.write(self.index_bytes(file.tell()))
+        # the game goes on without the replay when it cannot be written
+        except OSError as error:
+            print("Cannot write the replay:", error)
+
+    # Returns the bytes after the last chunk (the zero length that ends the
+    # chunks, the index and the trailer), where offset is the current offset
+    def index_bytes(self, offset):
+        buffer = bytearray([0])
+        index_offset = offset + 1
+        write_varint(buffer, len(self.index))
+        for locked_count, time_ms, chunk_offset in self.index:
+            write_varint(buffer, locked_count)
+            write_varint(buffer, time_ms)
+            write_varint(buffer, chunk_offset)
+        buffer += TRAILER.pack(index_offset, INDEX_MAGIC)
+        return bytes(buffer)
+
+# A class that records the game of an engine (it is the recorder of the engine,
+# see Engine.recorder). Every action and event is a record of a kind byte, the
+# milliseconds since the previous record and the data of the kind. The records
+# are collected in memory in the game loop, which only appends a few bytes
+# each time, and every keyframe_interval locked pieces the chunk is handed to
+# the writer thread and a new chunk is started with a keyframe.
+class ReplayRecorder:
+    # A constructor for recording the game of the given engine (from its
+    # current state) into the replay file with the given path
+    def __init__(self, engine, path, keyframe_interval=KEYFRAME_INTERVAL,
+                 clock=time.monotonic):
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self.start_clock = clock()
+        header = ReplayHeader(engine.grid_height, engine.grid_width,
+                              engine.seed, engine.generator.mode,
+                              keyframe_interval, int(time.time()))
+        self.writer = ReplayWriter(path, header)
+        # the records of the current chunk, the time (in milliseconds) of the
+        # last record and the locked count and time of the first keyframe
+        self.chunk = bytearray()
+        self.last_time = 0
+        self.chunk_start = (0, 0)
+        # the locked count of the last keyframe (a keyframe is due when it is
+        # keyframe_interval pieces behind, and it is written when there are no
+        # full rows waiting to be removed)
+        self.keyframe_count = 0
+        self.closed = False
+        self.write_keyframe()
+        engine.recorder = self
+        _open_recorders.add(self)
+
+    # Appends the kind byte and the time delta of a record to the current
+    # chunk. The delta is stored in the high 4 bits of the kind byte when it is
+    # less than 15 milliseconds and as a varint after it otherwise.
+    def write_record(self, kind):
+        now = int((self.clock() - self.start_clock) * 1000)
+        delta = max(0, now - self.last_time)
+        self.last_time += delta
+        if delta < 15:
+            self.chunk.append(kind | (delta << 4))
+        else:
+            self.chunk.append(kind | 0xF0)
+            write_varint(self.chunk, delta - 15)
+
+    # Records an action (see ACTIONS) applied to the engine
+    def record_action(self, action):
+        if not self.closed:
+            self.write_record(ACTIONS.index(action))
+
+    # Records a lock with the score and the status after it, and writes a
+    # keyframe when it is due
+    def record_lock(self, engine):
+        if self.closed:
+            return
+        self.write_record(LOCK)
+        write_varint(self.chunk, engine.score)
+        self.chunk.append(game_status(engine))
+        self.check_keyframe(engine)
+
+    # Records the removal of the full rows and writes a keyframe when it is due
+    def record_clear(self, engine):
+        if self.closed:
+            return
+        self.write_record(ACTIONS.index("clear"))
+        self.check_keyframe(engine)
+
+    # Starts a new chunk with a keyframe when it is due (keyframes are only
+    # written between the pieces, when the new piece has just entered)
+    def check_keyframe(self, engine):
+        if engine.is_finished() or engine.full_rows:
+            return
+        if engine.locked_count - self.keyframe_count >= self.keyframe_interval:
+            self.flush_chunk()
+            self.write_keyframe()
+
+    # Hands the current chunk to the writer thread
+    def flush_chunk(self):
+        if self.chunk:
+            locked_count, time_ms = self.chunk_start
+            self.writer.write_chunk(locked_count, time_ms, bytes(self.chunk))
+        self.chunk = bytearray()
+
+    # Starts a chunk with a keyframe of the engine (the locked count, the score
+    # and the cells of the grid). The time of the keyframe is stored from 0, so
+    # the times in a chunk do not depend on the chunks before it.
+    def write_keyframe(self):
+        engine = self.engine
+        self.last_time = 0
+        self.write_record(KEYFRAME)
+        self.chunk_start = (engine.locked_count, self.last_time)
+        self.keyframe_count = engine.locked_count
+        write_varint(self.chunk, engine.locked_count)
+        write_varint(self.chunk, engine.score)
+        self.chunk += engine.grid.snapshot()
+
+    # Records the end of the game and finishes the file (the writer thread
+    # finishes it later, the game loop does not wait for it)
+    def close(self):
+        if self.closed:
+            return
+        self.write_record(END)
+        write_varint(self.chunk, self.engine.score)
+        self.chunk.append(game_status(self.engine))
+        self.flush_chunk()
+        self.writer.close()
+        self.closed = True
+        _open_recorders.discard(self)
+        if self.engine.recorder is self:
+            self.engine.recorder = None
+
+# the recorders that have not been closed yet
+_open_recorders = set()
+
+# Closes the recorders that are still open and waits (at most the given number
+# of seconds for each) until their files are finished. It is called when the
+# program exits, e.g. through sys.exit() when the window is closed in the
+# middle of a recorded game.
+def close_open_recorders(timeout=5):
+    for recorder in list(_open_recorders):
+        recorder.close()
+        recorder.writer.wait(timeout)
+
+atexit.register(close_open_recorders)
+
+# A class for reading a replay file. The records are (time, kind, data) tuples,
+# where time is in milliseconds since the start of the game, kind is one of
+# KINDS and data is None for the actions, (score, status) for the lock and end
+# records and (locked count, score, cells) for the keyframes.
+class ReplayReader:
+    # A constructor that reads the replay file with the given path
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = file.read()
+        self.header, self.chunks_offset = ReplayHeader.from_bytes(self.data)
+        self.grid_cell_count = self.header.grid_height * self.header.grid_width
+        # the (locked count, time, offset) of each chunk
+        self.index = self.read_index()
+
+    # Reads the index at the end of the file, or else finds the chunks by
+    # reading the file from the beginning
+    def read_index(self):
+        if len(self.data) >= TRAILER.size:
+            index_offset, magic = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                count, pos = read_varint(self.data, index_offset)
+                index = []
+                for _ in range(count):
+                    locked_count, pos = read_varint(self.data, pos)
+                    time_ms, pos = read_varint(self.data, pos)
+                    offset, pos = read_varint(self.data, pos)
+                    index.append((locked_count, time_ms, offset))
+                return index
+        index = []
+        pos = self.chunks_offset
+        try:
+            while pos < len(self.data):
+                length, data_pos = read_varint(self.data, pos)
+                if length == 0 or data_pos + length > len(self.data):
+                    break
+                # the keyframe at the start of the chunk gives its entry
+                records = self.decode_chunk(pos)
+                time_ms, kind, (locked_count, score, cells) = records[0]
+                index.append((locked_count, time_ms, pos))
+                pos = data_pos + length
+        # a chunk that was being written when the file was cut is skipped
+        except (IndexError, zlib.error):
+            pass
+        return index
+
+    # Returns the records of the chunk at the given offset
+    def decode_chunk(self, offset):
+        length, pos = read_varint(self.data, offset)
+        data = zlib.decompress(self.data[pos:pos + length])
+        records = []
+        time_ms, pos = 0, 0
+        while pos < len(data):
+            byte = data[pos]
+            pos += 1
+            kind, delta = byte & 0x0F, byte >> 4
+            if delta == 15:
+                delta, pos = read_varint(data, pos)
+                delta += 15
+            time_ms += delta
+            if kind == LOCK or kind == END:
+                score, pos = read_varint(data, pos)
+                record = (score, data[pos])
+                pos += 1
+            elif kind == KEYFRAME:
+                locked_count, pos = read_varint(data, pos)
+                score, pos = read_varint(data, pos)
+                cells = data[pos:pos + self.grid_cell_count]
+                pos += self.grid_cell_count
+                record = (locked_count, score, cells)
+            else:
+                record = None
+            records.append((time_ms, KINDS[kind], record))
+        return records
+
+    # Returns the records of the chunk with the given index number
+    def read_chunk(self, chunk):
+        return self.decode_chunk(self.index[chunk][2])
+
+    # Returns the records of the whole game starting from the chunk with the
+    # given index number
+    def records(self, first_chunk=0):
+        for chunk in range(first_chunk, len(self.index)):
+            yield from self.read_chunk(chunk)
+
+    # Returns the index number of the last chunk that starts at or before the
+    # given number of locked pieces (its keyframe is the closest one to seek)
+    def find_chunk(self, locked_count):
+        found = 0
+        for chunk, (chunk_count, time_ms, offset) in enumerate(self.index):
+            if chunk_count > locked_count:
+                break
+            found = chunk
+        return found
+
+    # Returns an engine (created by engine_class) in the state of the keyframe
+    # of the given chunk, so a game can be watched or checked from there
+    # without playing it from the start
+    def engine_at(self, chunk, engine_class, **engine_args):
+        if not self.index:
+            raise ValueError("no complete chunk in the replay file")
+        header = self.header
+        time_ms, kind, (locked_count, score, cells) = self.read_chunk(chunk)[0]
+        engine = engine_class(header.grid_height, header.grid_width,
+                              seed=header.seed, piece_mode=header.piece_mode,
+                              **engine_args)
+        engine.restore(cells, score, locked_count)
+        return engine
+
+# Records the game of the given engine into a new replay file in the given
+# directory (named after the current time and the seed of the game) and
+# returns the recorder
+def record_game(engine, directory, keyframe_interval=KEYFRAME_INTERVAL):
+    file_name = "%s-%03d-%d.t2r" % (time.strftime("%Y%m%d-%H%M%S"),
+                                    int(time.time() * 1000) % 1000, engine.seed)
+    return ReplayRecorder(engine, os.path.join(directory, file_name),
+                          keyframe_interval)
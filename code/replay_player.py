@@ -0,0 +1,302 @@
+################################################################################
+#                                                                              #
+# The replay player of Tetris 2048 (verifying and watching the replay files)   #
+#                                                                              #
+################################################################################
+
+import os  # used for finding the replay files in a directory
+import sys  # the command line arguments
+import time  # used for timing the verification and the playback
+import zlib  # the errors of the corrupt replay files
+import multiprocessing  # the worker processes of the batch verification
+import subprocess  # the program exited in the middle of a recorded game
+import tempfile  # the directory of the replay files of the checks
+from engine import Engine  # the headless game engine (rules and scoring)
+from replay import (ReplayReader, PLAYING, LOST, WON, apply_action,
+                    game_status)  # the replay files
+
+# the names of the game statuses used in the reports
+STATUS_NAMES = {PLAYING: "playing", LOST: "lost", WON: "won"}
+
+# A class for modeling the result of playing a replay file again
+class ReplayResult:
+    def __init__(self, path):
+        self.path = path
+        # the final state of the game played again
+        self.score = 0
+        self.locked_count = 0
+        self.status = PLAYING
+        # True when the end of the game is in the file (a file that was cut
+        # short ends without it)
+        self.complete = False
+        # the (time, locked count, message) of the checkpoints (the locks,
+        # the keyframes and the end) the game played again does not match
+        self.divergences = []
+        # the error message when the file cannot be read
+        self.error = None
+        # the time (in seconds) it took to play the game again
+        self.seconds = 0.0
+
+    # Returns True when the file is read and the game matches all of its
+    # checkpoints
+    def ok(self):
+        return self.error is None and not self.divergences
+
+    # Returns a one line report of this result
+    def report(self):
+        if self.error is not None:
+            return "%s: error: %s" % (self.path, self.error)
+        text = "%s: score %d, %d pieces, %s" % (self.path, self.score,
+            self.locked_count, STATUS_NAMES[self.status])
+        if not self.complete:
+            text += " (incomplete)"
+        if self.divergences:
+            time_ms, locked_count, message = self.divergences[0]
+            text += ", %d divergences, first at %.2f s (piece %d): %s" % (
+                len(self.divergences), time_ms / 1000, locked_count, message)
+        return text
+
+# Plays the game of the given replay file again on a headless engine as fast
+# as possible (starting from the keyframe of the given piece) and returns its
+# ReplayResult. The game is checked against the score and the status recorded
+# at every lock and at the end and against the grid of every keyframe (at most
+# max_divergences mismatches are reported).
+def verify_replay(path, from_piece=0, max_divergences=10):
+    result = ReplayResult(path)
+    start_time = time.perf_counter()
+    try:
+        reader = ReplayReader(path)
+        chunk = reader.find_chunk(from_piece)
+        engine = reader.engine_at(chunk, Engine)
+        divergences = result.divergences
+        # the number of the locks recorded so far
+        locked_count = engine.locked_count
+        # the first record is the keyframe the engine is created from
+        records = reader.records(chunk)
+        next(records)
+        for time_ms, kind, data in records:
+            if data is None:
+                apply_action(engine, kind)
+                continue
+            if kind == "keyframe":
+                keyframe_count, score, cells = data
+                expected = (keyframe_count, score, bytes(cells))
+                actual = (engine.locked_count, engine.score, engine.grid.snapshot())
+                message = None if expected == actual else \
+                    "keyframe grid or score differs (score %d, recorded %d)" \
+                    % (engine.score, score)
+            else:  # lock or end
+                score, status = data
+                if kind == "lock":
+                    locked_count += 1
+                else:
+                    result.complete = True
+                expected = (locked_count, score, status)
+                actual = (engine.locked_count, engine.score, game_status(engine))
+                message = None if expected == actual else \
+                    "%s with %d pieces, score %d, %s (recorded %d, %d, %s)" \
+                    % (kind, engine.locked_count, engine.score,
+                       STATUS_NAMES[game_status(engine)], locked_count, score,
+                       STATUS_NAMES[status])
+            if message is not None and len(divergences) < max_divergences:
+                divergences.append((time_ms, engine.locked_count, message))
+        result.score = engine.score
+        result.locked_count = engine.locked_count
+        result.status = game_status(engine)
+    except (OSError, ValueError, IndexError, zlib.error) as error:
+        result.error = str(error) or type(error).__name__
+    result.seconds = time.perf_counter() - start_time
+    return result
+
+# Returns the paths of the replay files in the given paths (a directory gives
+# all the .t2r files in it)
+def find_replays(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.endswith(".t2r"))
+        else:
+            found.append(path)
+    return found
+
+# Verifies the given replay files in the given number of worker processes (as
+# many as the CPUs when None) and returns the ReplayResult of each file as
+# soon as it is ready (not in the order of the paths)
+def verify_replays(paths, processes=None):
+    if processes == 1 or len(paths) < 2:
+        for path in paths:
+            yield verify_replay(path)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        # a few files are sent to a worker at once to cut the messaging
+        chunk_size = max(1, min(16, len(paths) // (4 * (processes or os.cpu_count() or 1))))
+        yield from pool.imap_unordered(verify_replay, paths, chunk_size)
+
+# Plays the game of the given replay file on the screen at the given speed
+# (2 plays it twice as fast as it was played) starting from the keyframe of
+# the given piece. The game is drawn at most 60 times per second, so the
+# actions between two frames are applied without drawing them.
+def play_replay(path, speed=1.0, from_piece=0):
+    # the drawing modules are imported only for playing on the screen (the
+    # worker processes of the verification do not need them)
+    import lib.stddraw as stddraw
+    from game_grid import GameGrid
+    reader = ReplayReader(path)
+    grid_h, grid_w = reader.header.grid_height, reader.header.grid_width
+    # the same canvas as the game (see Tetris_2048.start)
+    stddraw.setCanvasSize(45 * grid_w + 180, 45 * grid_h)
+    stddraw.setXscale(-0.5, grid_w + 4 - 0.5)
+    stddraw.setYscale(-0.5, grid_h - 0.5)
+    chunk = reader.find_chunk(from_piece)
+    engine = reader.engine_at(chunk, Engine, grid_class=GameGrid)
+
+    # Draws the current state of the game
+    def display():
+        next_ = engine.next_tetromino.get_min_bounded_tile_matrix()
+        engine.grid.display(engine.score, False, False, next_=next_, delay=0)
+
+    frame_interval = 1 / 60
+    records = reader.records(chunk)
+    time_ms, kind, data = next(records)
+    # the clock time when the game was at the time of the first keyframe
+    start_time = time.monotonic() - time_ms / 1000 / speed
+    next_frame = 0.0
+    for time_ms, kind, data in records:
+        due_time = start_time + time_ms / 1000 / speed
+        while True:
+            now = time.monotonic()
+            if now >= next_frame:
+                display()
+                next_frame = now + frame_interval
+            if now >= due_time:
+                break
+            stddraw.pollEvents()
+            time.sleep(min(due_time, next_frame) - now)
+        if data is None:
+            apply_action(engine, kind)
+    display()
+    if engine.is_finished():
+        engine.grid.display_end_screen(engine.score, is_loss=engine.game_over)
+
+# the program run by check_exit_while_recording: it records a game into the
+# directory given as its first argument and exits in the middle of the game
+# with sys.exit() or, when its second argument is "quit", by closing the window
+# of stddraw (as the user closes the game window), and prints the number of
+# the locked pieces before it exits
+_EXIT_PROGRAM = """
+import random, sys
+from engine import Engine
+from replay import record_game
+directory, how = sys.argv[1], sys.argv[2]
+engine = Engine(seed=2048)
+record_game(engine, directory, keyframe_interval=5)
+moves = random.Random(engine.seed)
+while engine.locked_count < 30 and not engine.is_finished():
+    action = moves.choice(["left", "right", "rotate", None])
+    if action == "rotate":
+        engine.rotate()
+    elif action is not None:
+        engine.move(action)
+    if engine.step():
+        engine.clear_full_rows()
+print(engine.locked_count, flush=True)
+if how == "quit":
+    import pygame
+    import lib.stddraw as stddraw
+    stddraw.pollEvents()
+    pygame.event.post(pygame.event.Event(pygame.QUIT))
+    stddraw.pollEvents()
+sys.exit()
+"""
+
+# Checks that a program that exits in the middle of a recorded game (through
+# sys.exit() or by closing the window) ends within the given number of seconds
+# and leaves a replay file in the given directory that is complete and matches
+# its checkpoints. Returns the list of the problems found (empty when there are
+# none).
+def check_exit_while_recording(directory, timeout=30):
+    problems = []
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    # the window of stddraw is not shown
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    for how in ("exit", "quit"):
+        replay_dir = os.path.join(directory, how)
+        try:
+            process = subprocess.run(
+                [sys.executable, "-c", _EXIT_PROGRAM, replay_dir, how],
+                cwd=code_dir, env=env, timeout=timeout, capture_output=True,
+                text=True)
+        except subprocess.TimeoutExpired:
+            problems.append("%s: the program did not end in %d s" % (how, timeout))
+            continue
+        if process.returncode != 0:
+            problems.append("%s: the program failed: %s" % (how, process.stderr.strip()))
+            continue
+        paths = find_replays([replay_dir]) if os.path.isdir(replay_dir) else []
+        if len(paths) != 1:
+            problems.append("%s: %d replay files written" % (how, len(paths)))
+            continue
+        result = verify_replay(paths[0])
+        if not result.ok() or not result.complete:
+            problems.append("%s: %s" % (how, result.report()))
+        elif result.locked_count != int(process.stdout.split()[0]):
+            problems.append("%s: %d pieces in the replay, %s played" % (
+                how, result.locked_count, process.stdout.split()[0]))
+    return problems
+
+# Prints how to use the command line
+def _usage():
+    print("usage: python replay_player.py verify [-j processes] path...\n"
+          "       python replay_player.py play [-s speed] [-p piece] file\n"
+          "       python replay_player.py check [directory]")
+    sys.exit(2)
+
+# Verifies or plays the replay files given on the command line:
+#   verify [-j processes] path...  plays the replay files (all the .t2r files
+#                                  in a directory) headless and reports the
+#                                  files that do not match their checkpoints
+#   play [-s speed] [-p piece] file  plays a replay file on the screen (at the
+#                                    speed 1, 2, 8, ...) from the given piece
+#   check [directory]  checks that a program exited in the middle of a
+#                      recorded game ends and leaves a complete replay file
+#                      (in a temporary directory when none is given)
+def _main(args):
+    if args and args[0] == "check":
+        directory = args[1] if len(args) > 1 else tempfile.mkdtemp(prefix="t2r-check-")
+        problems = check_exit_while_recording(directory)
+        for problem in problems:
+            print(problem)
+        print("exit while recording: %s (%s)" % ("failed" if problems else "ok", directory))
+        sys.exit(1 if problems else 0)
+    if len(args) < 2 or args[0] not in ("verify", "play"):
+        _usage()
+    command, args = args[0], args[1:]
+    options = {}
+    while len(args) >= 2 and args[0] in ("-j", "-s", "-p"):
+        options[args[0]] = args[1]
+        args = args[2:]
+    if not args:
+        _usage()
+    if command == "play":
+        play_replay(args[0], float(options.get("-s", 1)), int(options.get("-p", 0)))
+        return
+    paths = find_replays(args)
+    processes = int(options["-j"]) if "-j" in options else None
+    start_time = time.perf_counter()
+    failed = incomplete = pieces = 0
+    for result in verify_replays(paths, processes):
+        pieces += result.locked_count
+        if not result.ok():
+            failed += 1
+            print(result.report())
+        elif not result.complete:
+            incomplete += 1
+    elapsed = time.perf_counter() - start_time
+    print("replays: %d, failed: %d, incomplete: %d, pieces: %d, time: %.2f s "
+          "(%.0f replays/s)" % (len(paths), failed, incomplete, pieces, elapsed,
+                                len(paths) / elapsed if elapsed else 0))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    _main(sys.argv[1:])
@@ -0,0 +1,93 @@
+################################################################################
+#                                                                              #
+# The fixed timestep scheduler used by the main loop of Tetris 2048            #
+#                                                                              #
+################################################################################
+
+import time  # the monotonic clock and the sleep between the ticks
+
+# A class for modeling a task that runs at a fixed interval (in seconds)
+class Timer:
+    # A constructor for creating a timer that calls the given callback every
+    # interval seconds (at most max_catch_up times in a row when it is late)
+    def __init__(self, interval, callback, max_catch_up=1):
+        self.interval = interval
+        self.callback = callback
+        self.max_catch_up = max_catch_up
+        # the clock time of the next call (set when the timer is reset)
+        self.next_time = 0.0
+        # a disabled timer does not run (and is not waited for)
+        self.enabled = True
+
+# A class for running the timers of the main loop on a monotonic clock, so the
+# gravity, the input sampling and the rendering have their own rates and none
+# of them has to sleep
+class Scheduler:
+    # A constructor for creating a scheduler without any timers (the clock can
+    # be replaced, e.g. for running the game faster than real time)
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.timers = {}
+
+    # Adds a timer with the given name that calls callback every interval
+    # seconds starting interval seconds from now
+    def add(self, name, interval, callback, max_catch_up=1, enabled=True):
+        timer = Timer(interval, callback, max_catch_up)
+        timer.enabled = enabled
+        timer.next_time = self.clock() + interval
+        self.timers[name] = timer
+        return timer
+
+    # Changes the interval of the named timer (the next call is interval
+    # seconds from now)
+    def set_interval(self, name, interval):
+        timer = self.timers[name]
+        timer.interval = interval
+        timer.next_time = self.clock() + interval
+
+    # Enables or disables the named timer (an enabled timer is reset, so its
+    # first call is one interval after it is enabled)
+    def set_enabled(self, name, enabled):
+        timer = self.timers[name]
+        if enabled and not timer.enabled:
+            timer.next_time = self.clock() + timer.interval
+        timer.enabled = enabled
+
+    # Restarts the named timer (all the timers when name is None) so that the
+    # next call is one interval from now (e.g. after a blocking menu, so the
+    # missed calls are not caught up)
+    def reset(self, name=None):
+        now = self.clock()
+        for timer_name, timer in self.timers.items():
+            if name is None or timer_name == name:
+                timer.next_time = now + timer.interval
+
+    # Calls the callbacks of the timers that are due (in the order the timers
+    # were added). A late timer is called again until it has caught up, but
+    # at most max_catch_up times, and the calls it still misses are dropped.
+    def run_due(self):
+        now = self.clock()
+        for timer in list(self.timers.values()):
+            calls = 0
+            while timer.enabled and timer.next_time <= now \
+                    and calls < timer.max_catch_up:
+                # the next time is set before the call, so the callback can
+                # reset the timer
+                timer.next_time += timer.interval
+                calls += 1
+                timer.callback()
+            if timer.enabled and timer.next_time <= now:
+                timer.next_time = now + timer.interval
+
+    # Returns the time (in seconds) until the next call of an enabled timer
+    def time_until_next(self):
+        times = [timer.next_time for timer in self.timers.values()
+                 if timer.enabled]
+        if not times:
+            return 0.0
+        return max(0.0, min(times) - self.clock())
+
+    # Sleeps until the next call of an enabled timer (the only place where the
+    # main loop sleeps)
+    def wait(self):
+        time.sleep(self.time_until_next())
@@ -0,0 +1,328 @@
+################################################################################
+#                                                                              #
+# The expectimax search player of Tetris 2048 (lookahead under a time budget)  #
+#                                                                              #
+################################################################################
+
+import time  # the time budget of the moves
+from engine import Engine  # the headless game engine
+from pieces import PieceGenerator  # the distribution of the unknown pieces
+from bot import (WeightedHeuristic, find_placements, simulate, play_action,
+                 get_placement_key, get_piece_key, SCORE_KEY)  # the placements and outcomes
+from transposition import TranspositionTable, KEY_MASK  # the evaluations
+
+# the values of a lost and a won game (finite, so they can be averaged in the
+# chance nodes)
+LOSS_VALUE, WIN_VALUE = -1e6, 1e6
+
+# the key mixed into the keys of the chance nodes
+CHANCE_KEY = 0x5DEECE66DB16A9C3
+
+# The exception raised inside the search when the time budget has run out
+class SearchTimeout(Exception):
+    pass
+
+# A class for modeling the result of a search: the best placement, its value,
+# the deepest depth searched completely, the number of the nodes (the
+# simulated placements) and the time it took
+class SearchResult:
+    def __init__(self, placement, value, depth, nodes, seconds):
+        self.placement = placement
+        self.value = value
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+
+    # The number of the nodes searched per second
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+# Returns the (shape, exponents, rotation, x, y) of the given tetromino where
+# it is now
+def piece_of_tetromino(tetromino):
+    position = tetromino.bottom_left_cell
+    exponents = [tile.exponent for tile in tetromino.tiles]
+    return (tetromino.type, exponents, tetromino.rotation_state,
+            position.x, position.y)
+
+# Returns the (shape, exponents, rotation, x, y) of the given Piece (see
+# pieces.py) when it enters a grid with the given height
+def piece_of_generator(piece, grid_height):
+    exponents = [number.bit_length() - 1 for number in piece.numbers]
+    return (piece.type, exponents, 0, piece.spawn_column, grid_height - 1)
+
+# Returns a settled copy of the given grid and the score gained while settling
+# it: the tiles that can merge are merged, the floating clumps are dropped and
+# the full rows are removed, as after a lock. A grid in the middle of a cascade
+# (e.g. after a single merge_tiles) can be searched from its settled state.
+def settle(board):
+    board = board.copy()
+    # every column is checked from its bottom
+    _, score = board.merge_cascade([(0, col) for col in range(board.grid_width)])
+    board.touched_rows = set(range(board.grid_height))
+    rows = board.find_full_rows()
+    if rows:
+        score += board.sum_scores_in_row(rows)
+        board.remove_full_rows(rows)
+    return board, score
+
+# A class for the computer player that searches the placements of the current
+# tetromino, of the next tetromino (it is shown, so it is known) and of the
+# unknown tetrominoes after them with expectimax. The unknown tetrominoes are
+# chance nodes, whose value is the mean value of the best placements of a few
+# tetrominoes drawn from a PieceGenerator (the type, the spawn column and the
+# 2 or 4 on each tile as in the game) seeded with the state, so a search is
+# repeatable. Only the best beam_width placements of a tetromino (by the
+# heuristic) are searched deeper. The depth (the number of the tetrominoes
+# placed) is increased one by one until max_depth or until the time budget
+# runs out, and the best placement of the deepest complete search is played.
+# The time budget is hard: the search stops time_margin seconds before it runs
+# out (the time is checked between the simulated placements), also in the
+# first depth, which then plays the best placement simulated so far.
+# The values and the best placements of the states are kept in a transposition
+# table, so the best placement of the previous depth is searched first.
+class ExpectimaxBot:
+    # A constructor for creating a player with the given time budget (in
+    # seconds) per move and the given search parameters
+    def __init__(self, time_budget=0.1, max_depth=4, beam_width=3,
+                 chance_samples=3, heuristic=None, table_size=1 << 18,
+                 time_margin=0.001):
+        self.time_budget = time_budget
+        self.time_margin = time_margin
+        self.max_depth = max_depth
+        self.beam_width = beam_width
+        self.chance_samples = chance_samples
+        self.heuristic = heuristic if heuristic is not None else WeightedHeuristic()
+        self.table = TranspositionTable(table_size)
+        # the (value, placement, outcome) of the placements simulated in the
+        # current move (keyed by get_placement_key), so the iterations of the
+        # deepening do not simulate them again
+        self.outcomes = {}
+        # the time the current search has to stop (None when it is not
+        # searching) and the nodes searched
+        self.deadline = None
+        self.nodes = 0
+        # the reachable placements of the piece being expanded and the
+        # (value, placement, outcome) of the ones simulated so far (see
+        # fallback_result)
+        self.expanding = ([], [])
+        # the (value, placement) of the best placement searched completely at
+        # the current depth (see search_root)
+        self.partial = None
+        # the result of the last move and the totals of all the moves
+        self.last_result = None
+        self.move_count, self.total_nodes, self.total_time, self.total_depth = 0, 0, 0.0, 0
+
+    # Raises SearchTimeout when the time budget of the current move has run out
+    def check_time(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    # Returns the value of the given outcome by the heuristic (a lost or a won
+    # game has a finite value)
+    def evaluate(self, outcome):
+        return min(max(self.heuristic(outcome), LOSS_VALUE), WIN_VALUE)
+
+    # Returns the (value, placement, outcome) of each reachable placement of
+    # the given piece on the given grid with the given score so far, best first
+    # by the heuristic and with the given best placement (the (rotation, x) from
+    # the transposition table) before all of them
+    def expand(self, board, score, piece, best_move=None):
+        shape, exponents, rotation, x, y = piece
+        placements = find_placements(board, shape, rotation, x, y)
+        children = []
+        self.expanding = (placements, children)
+        for placement in placements:
+            self.check_time()
+            key = get_placement_key(board, shape, exponents, placement, score)
+            child = self.outcomes.get(key) if key is not None else None
+            if child is None:
+                outcome = simulate(board, shape, exponents, placement)
+                outcome.score += score
+                self.nodes += 1
+                child = (self.evaluate(outcome), outcome)
+                if key is not None:
+                    self.outcomes[key] = child
+            children.append((child[0], placement, child[1]))
+        children.sort(key=lambda child: child[0], reverse=True)
+        for index, child in enumerate(children):
+            if (child[1].rotation, child[1].x) == best_move:
+                children.insert(0, children.pop(index))
+                break
+        return children
+
+    # Returns the value of placing the given piece (and then the given known
+    # pieces) on the given grid searched to the given depth and the best
+    # (rotation, x)
+    def search_max(self, board, score, piece, pieces, depth):
+        key = (board.zobrist_hash ^ (score * SCORE_KEY)
+               ^ get_piece_key(board, *piece)) & KEY_MASK
+        entry = self.table.lookup(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1], entry[2]
+        children = self.expand(board, score, piece, entry[2] if entry else None)
+        if depth == 1:
+            value, placement, outcome = max(children, key=lambda child: child[0])
+        else:
+            value, placement = LOSS_VALUE, children[0][1]
+            for child_value, child_placement, outcome in children[:self.beam_width]:
+                child_value = self.search_after(outcome, child_value, pieces, depth - 1)
+                if child_value > value:
+                    value, placement = child_value, child_placement
+        move = (placement.rotation, placement.x)
+        self.table.store(key, depth, value, move)
+        return value, move
+
+    # Returns the value of the given outcome searched to the given depth with
+    # the given known pieces placed next (and then the unknown ones)
+    def search_after(self, outcome, value, pieces, depth):
+        if outcome.lost or outcome.won:
+            return value
+        if pieces:
+            return self.search_max(outcome.board, outcome.score, pieces[0],
+                                   pieces[1:], depth)[0]
+        return self.search_chance(outcome.board, outcome.score, depth)
+
+    # Returns the expected value of placing an unknown piece on the given grid
+    # searched to the given depth (the mean over the sampled pieces)
+    def search_chance(self, board, score, depth):
+        key = (board.zobrist_hash ^ (score * SCORE_KEY) ^ CHANCE_KEY) & KEY_MASK
+        entry = self.table.lookup(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+        generator = PieceGenerator(board.grid_width, seed=key)
+        total = 0.0
+        for _ in range(self.chance_samples):
+            piece = piece_of_generator(generator.draw_piece(), board.grid_height)
+            total += self.search_max(board, score, piece, [], depth)[0]
+        value = total / self.chance_samples
+        self.table.store(key, depth, value)
+        return value
+
+    # Searches the placements of the first of the given pieces on the given
+    # grid to the given depth and returns the (value, placement) of the best
+    # one. The placements are searched in order (the best one of the previous
+    # depth first), and when the time runs out the best placement searched
+    # completely so far is kept in self.partial (None until one is complete,
+    # also when the time runs out while the placements are expanded).
+    def search_root(self, board, score, pieces, depth, best_move):
+        self.partial = None
+        children = self.expand(board, score, pieces[0], best_move)
+        if depth == 1:
+            value, placement, outcome = max(children, key=lambda child: child[0])
+            return value, placement
+        for child_value, placement, outcome in children[:self.beam_width]:
+            child_value = self.search_after(outcome, child_value, pieces[1:], depth - 1)
+            if self.partial is None or child_value > self.partial[0]:
+                self.partial = (child_value, placement)
+        return self.partial
+
+    # Returns the SearchResult (with the depth 0) of the best placement found
+    # when the time runs out in the first depth: the best one by the heuristic
+    # of the placements simulated so far, or the first reachable one when none
+    # of them is simulated
+    def fallback_result(self):
+        placements, children = self.expanding
+        if children:
+            value, placement, outcome = max(children, key=lambda child: child[0])
+            return SearchResult(placement, value, 0, 0, 0.0)
+        return SearchResult(placements[0], LOSS_VALUE, 0, 0, 0.0)
+
+    # Returns the SearchResult of searching the given grid (settled first, see
+    # settle) with the given known pieces (see piece_of_tetromino) to be
+    # placed in order
+    def search(self, board, pieces, score=0):
+        start_time = time.perf_counter()
+        # the time is checked between the placements, so the search stops a
+        # margin before the time budget runs out
+        self.deadline = start_time + max(self.time_budget - self.time_margin, 0.0)
+        self.nodes = 0
+        self.outcomes = {}
+        self.table.new_search()
+        board, settle_score = settle(board)
+        score += settle_score
+        result = None
+        for depth in range(1, self.max_depth + 1):
+            best_move = (result.placement.rotation, result.placement.x) if result else None
+            try:
+                value, placement = self.search_root(board, score, pieces, depth, best_move)
+            except SearchTimeout:
+                # the best placement of an incomplete depth is played when the
+                # best one of the previous depth (searched first) is complete
+                if result is None:
+                    result = self.fallback_result()
+                elif self.partial is not None:
+                    result.placement, result.value = self.partial[1], self.partial[0]
+                break
+            result = SearchResult(placement, value, depth, 0, 0.0)
+        self.deadline = None
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - start_time
+        return result
+
+    # Returns the best placement of the current tetromino of the given engine
+    # (None when the game has ended)
+    def choose_placement(self, engine):
+        if engine.is_finished():
+            return None
+        pieces = [piece_of_tetromino(engine.current_tetromino)]
+        if engine.next_tetromino is not None:
+            pieces.append(piece_of_tetromino(engine.next_tetromino))
+        result = self.search(engine.grid, pieces, engine.score)
+        self.last_result = result
+        self.move_count += 1
+        self.total_nodes += result.nodes
+        self.total_time += result.seconds
+        self.total_depth += result.depth
+        return result.placement
+
+    # Returns the actions (see bot.Placement) that play the best placement of
+    # the current tetromino of the given engine
+    def plan(self, engine):
+        placement = self.choose_placement(engine)
+        return list(placement.actions) if placement is not None else []
+
+    # Returns the mean depth, the nodes per second and the mean time per move
+    # (in seconds) of the moves so far
+    def stats(self):
+        moves = max(self.move_count, 1)
+        return {"moves": self.move_count,
+                "mean_depth": self.total_depth / moves,
+                "nodes_per_second": self.total_nodes / self.total_time if self.total_time else 0.0,
+                "seconds_per_move": self.total_time / moves}
+
+# A function that plays a game with the given player (a Bot or an
+# ExpectimaxBot) until it ends or max_pieces tetrominoes are locked and returns
+# the engine of the game
+def play_search_game(player, grid_h=20, grid_w=12, max_pieces=1000, seed=None):
+    engine = Engine(grid_h, grid_w, seed=seed)
+    while not engine.is_finished() and engine.locked_count < max_pieces:
+        for action in player.plan(engine):
+            play_action(engine, action)
+        engine.clear_full_rows()
+    return engine
+
+# Plays a number of headless games for each time budget (in milliseconds) given
+# on the command line and prints how strong the play is with each budget:
+#   python search.py [games] [max pieces] [budget in ms]...
+def _main():
+    import sys
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    max_pieces = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    budgets = [float(arg) for arg in sys.argv[3:]] or [10.0, 100.0]
+    for budget in budgets:
+        player = ExpectimaxBot(time_budget=budget / 1000)
+        scores, pieces = [], 0
+        for seed in range(n_games):
+            engine = play_search_game(player, max_pieces=max_pieces, seed=seed)
+            scores.append(engine.score)
+            pieces += engine.locked_count
+        stats = player.stats()
+        print("%5.0f ms: games: %d, pieces: %d, mean score: %.1f, mean depth: %.2f, "
+              "%.0f nodes/s, %.1f ms per move" % (budget, n_games, pieces,
+              sum(scores) / n_games, stats["mean_depth"], stats["nodes_per_second"],
+              stats["seconds_per_move"] * 1000))
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,173 @@
+################################################################################
+#                                                                              #
+# The audio manager of Tetris 2048 (sound effects, music, mute and volume)     #
+#                                                                              #
+################################################################################
+
+import threading  # the thread that loads the sounds
+import queue  # the jobs of the loading thread
+import time  # used for coalescing the bursts of the same sound effect
+import pygame
+
+# the file names (in the sounds directory) of the sound effects of the game
+SOUND_FILES = {
+    "lock": "block_place.wav",
+    "clear": "clear.wav",
+    "loss": "lose.wav",
+    "win": "win.wav",
+    "merge": "merge.wav",
+}
+
+# the number of the mixer channels used for the sound effects
+CHANNEL_COUNT = 4
+
+# the time (in seconds) in which the repeated plays of a sound effect are
+# merged into one playback (e.g. the merges of a long cascade)
+COALESCING_WINDOW = 0.08
+
+# A class that owns the audio of the game. The sound effects are loaded and the
+# music files are opened by a background thread, the sound effects are played
+# on a fixed pool of mixer channels, and the mute and the volume apply to both
+# the sound effects and the music. No method waits for the audio, and when the
+# mixer cannot be initialized (e.g. no audio device) nothing is played at all.
+class AudioManager:
+    # A constructor that initializes the mixer and starts loading the sound
+    # effects in the given directory
+    def __init__(self, sounds_dir, sound_files=SOUND_FILES,
+                 channel_count=CHANNEL_COUNT,
+                 coalescing_window=COALESCING_WINDOW):
+        self.sounds_dir = sounds_dir
+        self.coalescing_window = coalescing_window
+        self.muted = False
+        self.volume = 1.0
+        # the loaded sound effects by their names and the times they were
+        # last played
+        self.sounds = {}
+        self.last_played = {}
+        # the mixer channels of the sound effects and the names of the sound
+        # effects played on them last
+        self.channels = []
+        self.channel_sounds = []
+        # the loops of the opened music file (None until one is opened)
+        self.music_loops = None
+        try:
+            pygame.mixer.init()
+        except pygame.error as error:
+            print("Cannot initialize the audio:", error)
+            self.enabled = False
+            return
+        self.enabled = True
+        pygame.mixer.set_num_channels(channel_count)
+        # the channels are reserved, so only this manager plays on them
+        pygame.mixer.set_reserved(channel_count)
+        self.channels = [pygame.mixer.Channel(i) for i in range(channel_count)]
+        self.channel_sounds = [None] * channel_count
+        # the jobs run by the loading thread in the order they are added
+        self.jobs = queue.Queue()
+        for name, file_name in sound_files.items():
+            self.jobs.put(lambda name=name, file_name=file_name:
+                          self.load_sound(name, file_name))
+        self.thread = threading.Thread(target=self.run_jobs, daemon=True)
+        self.thread.start()
+
+    # Runs the jobs of the loading thread (forever)
+    def run_jobs(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                job()
+            # the game goes on without a sound that cannot be loaded
+            except (pygame.error, OSError) as error:
+                print("Cannot load the sound:", error)
+            finally:
+                self.jobs.task_done()
+
+    # Loads the sound effect with the given name (in the loading thread)
+    def load_sound(self, name, file_name):
+        self.sounds[name] = pygame.mixer.Sound(self.sounds_dir + "/" + file_name)
+
+    # Plays the sound effect with the given name unless the audio is muted,
+    # the sound effect is not loaded yet or it has been played within the
+    # coalescing window. The sound effect is played on an idle channel of the
+    # pool, or else on the channel that plays the same sound effect or on the
+    # first channel (a busy channel stops its sound effect).
+    def play(self, name):
+        if not self.enabled or self.muted:
+            return
+        sound = self.sounds.get(name)
+        if sound is None:
+            return
+        now = time.monotonic()
+        if now - self.last_played.get(name, -self.coalescing_window) \
+                < self.coalescing_window:
+            return
+        self.last_played[name] = now
+        index = self.find_channel(name)
+        channel = self.channels[index]
+        channel.set_volume(self.volume)
+        channel.play(sound)
+        self.channel_sounds[index] = name
+
+    # Returns the index of the channel of the pool to play the given sound
+    # effect on (see play)
+    def find_channel(self, name):
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return index
+        if name in self.channel_sounds:
+            return self.channel_sounds.index(name)
+        return 0
+
+    # Mutes or unmutes the sound effects and the music
+    def set_muted(self, muted):
+        self.muted = muted
+        self.apply_volume()
+
+    # Sets the volume (between 0 and 1) of the sound effects and the music
+    def set_volume(self, volume):
+        self.volume = min(max(volume, 0.0), 1.0)
+        self.apply_volume()
+
+    # Applies the mute and the volume to the music and the playing channels
+    def apply_volume(self):
+        if not self.enabled:
+            return
+        volume = 0.0 if self.muted else self.volume
+        pygame.mixer.music.set_volume(volume)
+        for channel in self.channels:
+            channel.set_volume(volume)
+
+    # Stops the current music, and opens and plays the given music file (in
+    # the loading thread, after the sound effects are loaded). All the music
+    # jobs run in the loading thread in the order they are called, so a stop
+    # or a restart never races with the opening of the music file.
+    def play_music(self, file_name, loops=-1):
+        if not self.enabled:
+            return
+        def job():
+            pygame.mixer.music.stop()
+            pygame.mixer.music.load(self.sounds_dir + "/" + file_name)
+            self.music_loops = loops
+            pygame.mixer.music.play(loops=loops)
+            self.apply_volume()
+        self.jobs.put(job)
+
+    # Stops the music (e.g. when the game is paused)
+    def stop_music(self):
+        if self.enabled:
+            self.jobs.put(pygame.mixer.music.stop)
+
+    # Plays the current music again from its beginning (e.g. when the game is
+    # continued) unless no music file is opened yet
+    def restart_music(self):
+        if not self.enabled:
+            return
+        def job():
+            if self.music_loops is not None:
+                pygame.mixer.music.play(loops=self.music_loops)
+        self.jobs.put(job)
+
+    # Waits until all the sound effects and the music files are loaded
+    def wait_until_loaded(self):
+        if self.enabled:
+            self.jobs.join()
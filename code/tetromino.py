@@ -1,91 +1,205 @@
 from tile import Tile  # used for modeling each tile on the tetrominoes
 from point import Point  # used for tile positions
-import copy as cp  # the copy module is used for copying tiles and positions
 import random  # the random module is used for generating random values
 import numpy as np  # the fundamental Python module for scientific computing
 
-# A class for modeling tetrominoes with 3 out of 7 different types as I, O and Z
+# The shapes of the tetrominoes in their initial rotation state as the size n of
+# their n x n tile matrix and the (column_index, row_index) of their occupied
+# cells (see the documentation given with this code). The tiles of a tetromino
+# are created in this order and keep their order in all rotation states.
+SHAPES = {
+   'I': (4, [(1, 0), (1, 1), (1, 2), (1, 3)]),
+   'O': (2, [(0, 0), (1, 0), (0, 1), (1, 1)]),
+   'Z': (3, [(0, 1), (1, 1), (1, 2), (2, 2)]),
+   'J': (3, [(1, 0), (1, 1), (1, 2), (0, 2)]),
+   'L': (3, [(0, 0), (0, 1), (0, 2), (1, 2)]),
+   'S': (3, [(0, 2), (1, 2), (1, 1), (2, 1)]),
+   'T': (3, [(0, 1), (1, 1), (2, 1), (1, 2)]),
+}
+
+# The shapes of the tetrominoes in the spawn state of the Super Rotation System
+# (SRS) given as in SHAPES. The SRS rotates them around the center of their
+# tile matrix and its wall kicks below are defined for these rotation states.
+SRS_SHAPES = {
+   'I': (4, [(0, 1), (1, 1), (2, 1), (3, 1)]),
+   'Z': (3, [(0, 0), (1, 0), (1, 1), (2, 1)]),
+   'J': (3, [(0, 0), (0, 1), (1, 1), (2, 1)]),
+   'L': (3, [(2, 0), (0, 1), (1, 1), (2, 1)]),
+   'S': (3, [(1, 0), (2, 0), (0, 1), (1, 1)]),
+   'T': (3, [(1, 0), (0, 1), (1, 1), (2, 1)]),
+}
+
+# The wall kicks of the SRS tried (in order) when a tetromino is rotated to the
+# right from the SRS rotation state given by the index (0: spawn, 1: right, 2:
+# two rotations, 3: left), as (dx, dy) moves. The rotation states of this game
+# do not start from the SRS spawn state and do not rotate around the same cell
+# (e.g. the L and the I tetromino), so these kicks are realigned to them in
+# _compute_wall_kicks before they are used.
+WALL_KICKS = [
+   [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+   [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+   [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+   [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+]
+I_WALL_KICKS = [
+   [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+   [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+   [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+   [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+]
+O_WALL_KICKS = [[(0, 0)]] * 4
+
+# A class for modeling one rotation state of a tetromino type. All the values
+# are computed once (when this module is imported) from the occupied cells.
+class RotationState:
+   # A constructor for creating a rotation state from the occupied cells of
+   # an n x n tile matrix given in the tile order
+   def __init__(self, n, cells):
+      self.n = n
+      # the (column_index, row_index) of the cell of each tile
+      self.cells = tuple(cells)
+      # the (dx, dy) offset of the cell of each tile from the bottom left cell
+      self.offsets = tuple((col, (n - 1) - row) for col, row in cells)
+      # the bounding box of the occupied cells in the tile matrix
+      self.min_col = min(col for col, row in cells)
+      self.max_col = max(col for col, row in cells)
+      self.min_row = min(row for col, row in cells)
+      self.max_row = max(row for col, row in cells)
+      # the occupancy bitmask of each occupied row as (row offset above the
+      # bottom left cell, mask) pairs where bit i is set when column i is
+      # occupied (used by Board.fits for the collision checks)
+      masks = {}
+      for dx, dy in self.offsets:
+         masks[dy] = masks.get(dy, 0) | (1 << dx)
+      self.row_masks = sorted(masks.items())
+      # the lowest occupied row offset of each occupied column (bottom profile)
+      # and the leftmost and the rightmost occupied column of each occupied row
+      # (left and right profiles)
+      self.bottom_profile, self.left_profile, self.right_profile = {}, {}, {}
+      for dx, dy in self.offsets:
+         self.bottom_profile[dx] = min(dy, self.bottom_profile.get(dx, dy))
+         self.left_profile[dy] = min(dx, self.left_profile.get(dy, dx))
+         self.right_profile[dy] = max(dx, self.right_profile.get(dy, dx))
+
+# Computes the four rotation states of the given tetromino type by rotating the
+# cells of its initial rotation state to the right
+def _compute_rotation_states(shape):
+   n, cells = SHAPES[shape]
+   states = []
+   for _ in range(4):
+      states.append(RotationState(n, cells))
+      # (transpose + reverse rows) the cell in the row i and the column j moves
+      # to the row j and the column n - 1 - i
+      cells = [((n - 1) - row, col) for col, row in cells]
+      if shape == 'I':
+         # the I tetromino stays on column 1 of its tile matrix when it is
+         # vertical and on the bottom row when it is horizontal
+         if cells[0][0] == cells[1][0]:
+            cells = [(1, row) for col, row in cells]
+         else:
+            cells = [(col, n - 1) for col, row in cells]
+   return states
+
+# The rotation states of all the tetromino types, indexed by rotation_state
+ROTATION_TABLES = {shape: _compute_rotation_states(shape) for shape in SHAPES}
+
+# Returns the (srs_state, dx, dy) of each rotation state of the given tetromino
+# type: the SRS rotation state with the same shape and the (dx, dy) offset of
+# its cells from the cells of that SRS rotation state. The S, Z and I shapes
+# match two SRS rotation states, so the match with the smallest offsets is used.
+def _match_srs_states(shape):
+   n, cells = SRS_SHAPES[shape]
+   srs_offsets = []
+   for _ in range(4):
+      srs_offsets.append(sorted(RotationState(n, cells).offsets))
+      cells = [((n - 1) - row, col) for col, row in cells]
+   best = None
+   for first in range(4):
+      matches = []
+      for index, state in enumerate(ROTATION_TABLES[shape]):
+         srs_state = (first + index) % 4
+         offsets, expected = sorted(state.offsets), srs_offsets[srs_state]
+         dx, dy = offsets[0][0] - expected[0][0], offsets[0][1] - expected[0][1]
+         if [(x - dx, y - dy) for x, y in offsets] != expected:
+            break
+         matches.append((srs_state, dx, dy))
+      else:
+         cost = sum(abs(dx) + abs(dy) for _, dx, dy in matches)
+         if best is None or cost < best[0]:
+            best = (cost, matches)
+   return best[1]
+
+# Computes the wall kicks of the given tetromino type for each of its rotation
+# states as (dx, dy) moves of the bottom left cell. The SRS kicks of the
+# matching SRS rotation state are moved by the change of the offset from the
+# SRS cells, so each kick puts the tiles in the cells the SRS puts them in.
+def _compute_wall_kicks(shape):
+   if shape == 'O':
+      return O_WALL_KICKS
+   srs_kicks = I_WALL_KICKS if shape == 'I' else WALL_KICKS
+   matches = _match_srs_states(shape)
+   kicks = []
+   for index, (srs_state, dx, dy) in enumerate(matches):
+      _, next_dx, next_dy = matches[(index + 1) % 4]
+      kicks.append([(kick_x + dx - next_dx, kick_y + dy - next_dy)
+                    for kick_x, kick_y in srs_kicks[srs_state]])
+   return kicks
+
+# The wall kicks of all the tetromino types, indexed by rotation_state
+KICK_TABLES = {shape: _compute_wall_kicks(shape) for shape in SHAPES}
+
+# A class for modeling tetrominoes with 7 different types as I, O, Z, J, L, S
+# and T
 class Tetromino:
    # the dimensions of the game grid (defined as class variables)
    grid_height, grid_width = None, None
 
-   # A constructor for creating a tetromino with a given shape (type)
-   def __init__(self, shape):
+   # A constructor for creating a tetromino with a given shape (type), and with
+   # the given spawn column and tile numbers (random when they are not given,
+   # see PieceGenerator for the seeded ones)
+   def __init__(self, shape, spawn_column=None, numbers=None):
       self.rotation_state = 0
       self.type = shape  # set the type of this tetromino
-      # determine the occupied (non-empty) cells in the tile matrix based on
-      # the shape of this tetromino (see the documentation given with this code)
-      occupied_cells = []
-      if self.type == 'I':
-         n = 4  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino I in its initial rotation state
-         occupied_cells.append((1, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((1, 3))
-      elif self.type == 'O':
-         n = 2  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino O in its initial rotation state
-         occupied_cells.append((0, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 0))
-         occupied_cells.append((0, 1))
-         occupied_cells.append((1, 1))
-      elif self.type == 'Z':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((0, 1))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((2, 2))
-      
-      # These 4 are added later
-      elif self.type == 'J':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((1, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((0, 2))
-      elif self.type == 'L':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((0, 0))  # (column_index, row_index)
-         occupied_cells.append((0, 1))
-         occupied_cells.append((0, 2))
-         occupied_cells.append((1, 2))
-      elif self.type == 'S':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((0, 2))  # (column_index, row_index)
-         occupied_cells.append((1, 2))
-         occupied_cells.append((1, 1))
-         occupied_cells.append((2, 1))
-      elif self.type == 'T':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((0, 1))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((2, 1))
-         occupied_cells.append((1, 2))
-      
-      # create a matrix of numbered tiles based on the shape of this tetromino
-      self.tile_matrix = np.full((n, n), None)
-      # create the four tiles (minos) of this tetromino and place these tiles
-      # into the tile matrix
-      for i in range(len(occupied_cells)):
-         col_index, row_index = occupied_cells[i][0], occupied_cells[i][1]
-         # create a tile for each occupied cell of this tetromino
-         self.tile_matrix[row_index][col_index] = Tile()
+      # the rotation states of this tetromino type (see ROTATION_TABLES)
+      self.rotation_table = ROTATION_TABLES[shape]
+      n = self.rotation_table[0].n
+      # create the four tiles (minos) of this tetromino in the tile order of
+      # the rotation states
+      if numbers is None:
+         numbers = [None] * 4
+      self.tiles = [Tile(number) for number in numbers]
       # initialize the position of this tetromino (as the bottom left cell in
       # the tile matrix) with a random horizontal position above the game grid
       self.bottom_left_cell = Point()
       self.bottom_left_cell.y = Tetromino.grid_height - 1
-      self.bottom_left_cell.x = random.randint(0, Tetromino.grid_width - n)
+      if spawn_column is None:
+         spawn_column = random.randint(0, Tetromino.grid_width - n)
+      self.bottom_left_cell.x = spawn_column
+
+   # The current rotation state of this tetromino (a RotationState)
+   @property
+   def state(self):
+      return self.rotation_table[self.rotation_state]
+
+   # The row masks of the current rotation state (used for collision checks)
+   @property
+   def row_masks(self):
+      return self.rotation_table[self.rotation_state].row_masks
+
+   # The n x n matrix of the tiles of this tetromino in its current rotation
+   # state (None for the empty cells)
+   @property
+   def tile_matrix(self):
+      state = self.state
+      matrix = np.full((state.n, state.n), None)
+      for (col, row), tile in zip(state.cells, self.tiles):
+         matrix[row][col] = tile
+      return matrix
 
    # A method that computes and returns the position of the cell in the tile
    # matrix specified by the given row and column indexes
    def get_cell_position(self, row, col):
-      n = len(self.tile_matrix)  # n = number of rows = number of columns
+      n = self.state.n  # n = number of rows = number of columns
       position = Point()
       # horizontal position of the cell
       position.x = self.bottom_left_cell.x + col
@@ -93,53 +207,45 @@ class Tetromino:
       position.y = self.bottom_left_cell.y + (n - 1) - row
       return position
 
-   # A method to return a copy of the tile matrix without any empty row/column,
-   # and the position of the bottom left cell when return_position is set
+   # Returns the (row, col, tile) of each tile of this tetromino on the game
+   # grid (the rows can be above the game grid before the tetromino enters it)
+   def get_tile_positions(self):
+      x, y = self.bottom_left_cell.x, self.bottom_left_cell.y
+      return [(y + dy, x + dx, tile)
+              for (dx, dy), tile in zip(self.state.offsets, self.tiles)]
+
+   # A method to return the tile matrix without any empty row/column, and the
+   # position of the bottom left cell when return_position is set
    def get_min_bounded_tile_matrix(self, return_position=False):
-      n = len(self.tile_matrix)  # n = number of rows = number of columns
-      # determine rows and columns to copy (omit empty rows and columns)
-      min_row, max_row, min_col, max_col = n - 1, 0, n - 1, 0
-      for row in range(n):
-         for col in range(n):
-            if self.tile_matrix[row][col] is not None:
-               if row < min_row:
-                  min_row = row
-               if row > max_row:
-                  max_row = row
-               if col < min_col:
-                  min_col = col
-               if col > max_col:
-                  max_col = col
-      # copy the tiles from the tile matrix of this tetromino
-      copy = np.full((max_row - min_row + 1, max_col - min_col + 1), None)
-      for row in range(min_row, max_row + 1):
-         for col in range(min_col, max_col + 1):
-            if self.tile_matrix[row][col] is not None:
-               row_ind = row - min_row
-               col_ind = col - min_col
-               copy[row_ind][col_ind] = cp.deepcopy(self.tile_matrix[row][col])
-      # return just the matrix copy when return_position is not set (as True)
+      state = self.state
+      # the bounding box of the occupied cells comes from the rotation table
+      n_rows = state.max_row - state.min_row + 1
+      n_cols = state.max_col - state.min_col + 1
+      matrix = np.full((n_rows, n_cols), None)
+      for (col, row), tile in zip(state.cells, self.tiles):
+         matrix[row - state.min_row][col - state.min_col] = tile
+      # return just the matrix when return_position is not set (as True)
       # the argument return_position defaults to False when a value is not given
       if not return_position:
-         return copy
-      # otherwise return the position of the bottom left cell in copy as well
+         return matrix
+      # otherwise return the position of the bottom left cell in matrix as well
       else:
-         blc_position = cp.copy(self.bottom_left_cell)
-         blc_position.translate(min_col, (n - 1) - max_row)
-         return copy, blc_position
+         blc_position = Point(self.bottom_left_cell.x, self.bottom_left_cell.y)
+         blc_position.translate(state.min_col, (state.n - 1) - state.max_row)
+         return matrix, blc_position
+
+   # Returns the position of the bottom left cell where this tetromino lands
+   # when it is dropped straight down (used for hard drops and ghost pieces)
+   def get_landing_position(self, game_grid):
+      x, y = self.bottom_left_cell.x, self.bottom_left_cell.y
+      return Point(x, y - game_grid.get_drop_distance(self.state, x, y))
 
    # A method for drawing the tetromino on the game grid
    def draw(self):
-      n = len(self.tile_matrix)  # n = number of rows = number of columns
-      for row in range(n):
-         for col in range(n):
-            # draw each occupied cell as a tile on the game grid
-            if self.tile_matrix[row][col] is not None:
-               # get the position of the tile
-               position = self.get_cell_position(row, col)
-               # draw only the tiles that are inside the game grid
-               if position.y < Tetromino.grid_height:
-                  self.tile_matrix[row][col].draw(position)
+      for row, col, tile in self.get_tile_positions():
+         # draw only the tiles that are inside the game grid
+         if row < Tetromino.grid_height:
+            tile.draw(Point(col, row))
 
    # A method for moving this tetromino in a given direction by 1 on the grid
    def move(self, direction, game_grid):
@@ -158,113 +264,37 @@ class Tetromino:
 
    # A method for checking if this tetromino can be moved in a given direction
    def can_be_moved(self, direction, game_grid):
-      n = len(self.tile_matrix)  # n = number of rows = number of columns
-      # check for moving left or right
-      if direction == "left" or direction == "right":
-         for row_index in range(n):
-            for col_index in range(n):
-               # direction = left --> check the leftmost tile of each row
-               row, col = row_index, col_index
-               if direction == "left" and self.tile_matrix[row][col] is not None:
-                  # the position of the leftmost tile of the current row
-                  leftmost = self.get_cell_position(row, col)
-                  # if any leftmost tile is at x = 0
-                  if leftmost.x == 0:
-                     return False  # this tetromino cannot be moved left
-                  # if the grid cell on the left of a leftmost tile is occupied
-                  if game_grid.is_occupied(leftmost.y, leftmost.x - 1):
-                     return False  # this tetromino cannot be moved left
-                  # as the leftmost tile of the current row is checked
-                  break  # end the inner for loop
-               # direction = right --> check the rightmost tile of each row
-               row, col = row_index, n - 1 - col_index
-               if direction == "right" and self.tile_matrix[row][col] is not None:
-                  # the position of the rightmost tile of the current row
-                  rightmost = self.get_cell_position(row, col)
-                  # if any rightmost tile is at x = grid_width - 1
-                  if rightmost.x == Tetromino.grid_width - 1:
-                     return False  # this tetromino cannot be moved right
-                  # if the grid cell on the right of a rightmost tile is occupied
-                  if game_grid.is_occupied(rightmost.y, rightmost.x + 1):
-                     return False  # this tetromino cannot be moved right
-                  # as the rightmost tile of the current row is checked
-                  break  # end the inner for loop
-      # direction = down --> check the bottommost tile of each column
-      else:
-         for col in range(n):
-            for row in range(n - 1, -1, -1):
-               # if the current cell of the tetromino is occupied by a tile
-               if self.tile_matrix[row][col] is not None:
-                  # the position of the bottommost tile of the current col
-                  bottommost = self.get_cell_position(row, col)
-                  # if any bottommost tile is at y = 0
-                  if bottommost.y == 0:
-                     return False  # this tetromino cannot be moved down
-                  # if the grid cell below any bottommost tile is occupied
-                  if game_grid.is_occupied(bottommost.y - 1, bottommost.x):
-                     return False  # this tetromino cannot be moved down
-                  # as the bottommost tile of the current row is checked
-                  break  # end the inner for loop
-      # if this method does not end by returning False before this line
-      return True  # this tetromino can be moved in the given direction
+      # the position of the bottom left cell after the move
+      x, y = self.bottom_left_cell.x, self.bottom_left_cell.y
+      if direction == "left":
+         x -= 1
+      elif direction == "right":
+         x += 1
+      else:  # direction == "down"
+         y -= 1
+      # compare the row masks of this tetromino with the occupancy of the grid
+      return game_grid.fits(self.row_masks, x, y)
 
-   # A method for rotating the tetromino to the right
+   # A method for rotating the tetromino to the right (the first wall kick of
+   # the kick table that fits on the grid is applied)
    def rotate(self, game_grid):
-      # Create a new empty matrix of the same size
-      n = len(self.tile_matrix)
-      new_matrix = np.full((n, n), None)
-
-      # Collect existing tiles
-      if self.rotation_state == 0 and self.type == 'I':
-         tiles = [cell for row in self.tile_matrix[::-1] for cell in row[::-1] if cell is not None]
-      else:
-         tiles = [cell for row in self.tile_matrix for cell in row if cell is not None]
-
-      positions = []
-      # Define rotation rules for each tetromino type
-      if self.type == 'I':
-         # I has 2 rotation states (vertical/horizontal)
-         if self.rotation_state == 0:
-            positions = [(i, 3) for i in range(4)]
-         else:
-            positions = [(1, i) for i in range(4)]
-         self.rotation_state = (self.rotation_state + 1) % 2
-      elif self.type in ['O', 'T', 'L', 'J', 'S', 'Z']:
-         # Standard rotation for 3x3 matrices (transpose + reverse rows)
-         for i in range(n):
-            for j in range(n):
-               new_matrix[j][n - 1 - i] = self.tile_matrix[i][j]
-         self.tile_matrix = new_matrix
-         self.rotation_state = (self.rotation_state + 1) % 4
-         return True
-
-      # Place tiles in new positions
-      for (col, row), tile in zip(positions, tiles):
-         new_matrix[row][col] = tile
-      if not self.can_be_rotated(new_matrix, game_grid):
+      kick = self.get_rotation_kick(game_grid)
+      if kick is None:
          return False
-
-      self.tile_matrix = new_matrix
+      self.bottom_left_cell.translate(kick[0], kick[1])
+      self.rotation_state = (self.rotation_state + 1) % 4
       return True
 
    # A method for checking if it can be rotated
-   def can_be_rotated(self, matrix, game_grid):
-      occupied = False
-      n = len(matrix)
-      for row in range(n):
-         for col in range(n):
-            blc_position = cp.copy(self.bottom_left_cell)
-            position = Point()
-            position.x = blc_position.x + col
-            position.y = blc_position.y + (n - 1) - row
-            inside = game_grid.is_inside(position.y, position.x)
-            if inside:
-               occupied = game_grid.tile_matrix[position.y][position.x] is not None
-
-            if not inside:
-               return False
-
-            if occupied:
-               return False
+   def can_be_rotated(self, game_grid):
+      return self.get_rotation_kick(game_grid) is not None
 
-      return True
\ No newline at end of file
+   # Returns the first (dx, dy) wall kick with which the rotated tetromino fits
+   # on the game grid, or None when it cannot be rotated
+   def get_rotation_kick(self, game_grid):
+      next_state = self.rotation_table[(self.rotation_state + 1) % 4]
+      x, y = self.bottom_left_cell.x, self.bottom_left_cell.y
+      for dx, dy in KICK_TABLES[self.type][self.rotation_state]:
+         if game_grid.fits(next_state.row_masks, x + dx, y + dy):
+            return dx, dy
+      return None
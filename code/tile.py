@@ -1,5 +1,4 @@
-import lib.stddraw as stddraw  # used for drawing the tiles to display them
-from lib.color import Color, COLOR_DICT   # used for coloring the tiles
+from lib.color import Color, EXPONENT_COLORS, FULL_ROW_COLORS  # used for coloring the tiles
 from random import randint
 
 # A class for modeling numbered tiles as in 2048
@@ -10,23 +9,79 @@ class Tile:
    font_family, font_size = "Sans Serif", 23
    # the value of the boundary thickness (for the boxes around the tiles)
    boundary_thickness = 0.003
-   # A constructor that creates a tile with 2 as the number on it
-   def __init__(self):
+   # the shared (read-only) tiles used for drawing the exponent-encoded cells of
+   # the game grid, keyed by (exponent, highlighted)
+   _shared_tiles = {}
+   # the pre-rendered (off-screen) images of the tiles keyed by their looks
+   # (see draw) and the scale version of stddraw they are rendered with
+   _sprites = {}
+   _sprites_scale_version = None
+
+   # A constructor that creates a tile with 2 or 4 (chosen randomly) as the
+   # number on it when no number is given
+   def __init__(self, number=None):
       # set the number on this tile
-      self.number = (randint(1, 2)*2)
+      if number is None:
+         number = randint(1, 2) * 2
+      self.number = number
       
-      # set the colors of this tile
-      if self.number == 2:
-         self.background_color = COLOR_DICT[2][0]  # background (tile) color
-         self.foreground_color = COLOR_DICT[2][1]  # foreground (number) color
-      else:
-         self.background_color = COLOR_DICT[4][0]  # background (tile) color
-         self.foreground_color = COLOR_DICT[4][1]  # foreground (number) color
+      # set the colors of this tile by using the exponent of its number
+      self.background_color, self.foreground_color = tile_colors(self.exponent)
 
       self.box_color = Color(187, 173, 159)  # box (boundary) color
 
+   # The exponent of the number on this tile (number = 2 ** exponent)
+   @property
+   def exponent(self):
+      return self.number.bit_length() - 1
+
+   # Returns the shared tile for drawing a grid cell that stores the given
+   # exponent (the tiles are highlighted when the row of the cell is full)
+   @staticmethod
+   def from_exponent(exponent, highlighted=False):
+      key = (exponent, highlighted)
+      tile = Tile._shared_tiles.get(key)
+      if tile is None:
+         tile = Tile(2 ** exponent)
+         if highlighted:
+            tile.background_color, tile.foreground_color = FULL_ROW_COLORS
+         Tile._shared_tiles[key] = tile
+      return tile
+
    # A method for drawing this tile at a given position with a given length
    def draw(self, position, length=1):  # length defaults to 1
+      # stddraw (and so pygame) is imported only when a tile is drawn, so the
+      # game rules can run headless without it
+      import lib.stddraw as stddraw
+      # the sprites are out of date when the canvas size or scale has changed
+      if Tile._sprites_scale_version != stddraw.scaleVersion():
+         Tile._sprites.clear()
+         Tile._sprites_scale_version = stddraw.scaleVersion()
+      # each look of the tiles (the number, the colors, the length and the
+      # sub-cell offset of the position) is rendered only once off-screen
+      # and then drawn with a single blit
+      key = (self.number, self.background_color.getRed(),
+             self.background_color.getGreen(), self.background_color.getBlue(),
+             self.foreground_color.getRed(), self.foreground_color.getGreen(),
+             self.foreground_color.getBlue(), length,
+             position.x % 1, position.y % 1)
+      # the region of the sprite is the square of the tile (the pixels around
+      # it have the color key magenta that is not used by the tiles)
+      min_x, max_x = position.x + 0.04 - length / 2, position.x + 0.04 + length / 2
+      min_y, max_y = position.y - 0.03 - length / 2, position.y - 0.03 + length / 2
+      sprite = Tile._sprites.get(key)
+      if sprite is None:
+         stddraw.beginOffscreen(min_x, min_y, max_x, max_y,
+                                colorKey=stddraw.MAGENTA)
+         self.render(position, length)
+         sprite = stddraw.endOffscreen()
+         Tile._sprites[key] = sprite
+      stddraw.blitOffscreen(sprite, min_x, max_y)
+
+   # A method for rendering this tile with the drawing primitives of stddraw
+   # (used for rendering the sprites in draw)
+   def render(self, position, length=1):
+      import lib.stddraw as stddraw
       # draw the tile as a filled square
       stddraw.setPenColor(self.background_color)
       stddraw.filledSquare(position.x+0.04, position.y-0.03, length / 2)
@@ -41,3 +96,8 @@ class Tile:
       stddraw.setFontFamily(Tile.font_family)
       stddraw.setFontSize(Tile.font_size)
       stddraw.text(position.x, position.y, str(self.number))
+
+# Returns the (background, foreground) colors of the tiles with the number
+# 2 ** exponent (the numbers above 2048 use the colors of 2048)
+def tile_colors(exponent):
+   return EXPONENT_COLORS[min(exponent, len(EXPONENT_COLORS) - 1)]
@@ -0,0 +1,90 @@
+################################################################################
+#                                                                              #
+# The transposition table of Tetris 2048 (evaluations keyed by board hashes)   #
+#                                                                              #
+################################################################################
+
+# the mask of the 64-bit keys
+KEY_MASK = (1 << 64) - 1
+
+# A class for modeling a bounded table of the evaluations of the game states
+# keyed by their 64-bit hashes (e.g. the Zobrist hash of the grid, see
+# Board.zobrist_hash, combined with the pieces to be placed). Each entry stores
+# the value of a state, the depth it was searched to and the best move found.
+# The table has a fixed number of buckets of two entries: the first entry of a
+# bucket keeps the deepest evaluation (it is replaced by a deeper one or by any
+# one when it is from an older search), the second one keeps the latest one,
+# so the valuable entries survive while the table still learns new states.
+class TranspositionTable:
+    # A constructor for creating a table with the given number of entries
+    # (rounded up to a power of two)
+    def __init__(self, size=1 << 16):
+        bucket_count = 1
+        while bucket_count * 2 < size:
+            bucket_count *= 2
+        self.mask = bucket_count - 1
+        # the (key, depth, age, value, move) entries (None when empty), the
+        # entries 2 * i and 2 * i + 1 are the bucket i
+        self.entries = [None] * (bucket_count * 2)
+        # the age of the current search (see new_search)
+        self.age = 0
+        # the statistics of the lookups and the stores
+        self.hits, self.misses, self.stores, self.replacements = 0, 0, 0, 0
+
+    # Starts a new search, so the deep entries of the older searches can be
+    # replaced by the entries of this one
+    def new_search(self):
+        self.age += 1
+
+    # Returns the (depth, value, move) stored for the given key, or None when
+    # the key is not in the table
+    def lookup(self, key):
+        index = (key & self.mask) * 2
+        entries = self.entries
+        for entry in (entries[index], entries[index + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1], entry[3], entry[4]
+        self.misses += 1
+        return None
+
+    # Stores the value and the best move of the state with the given key
+    # searched to the given depth
+    def store(self, key, depth, value, move=None):
+        index = (key & self.mask) * 2
+        entries = self.entries
+        entry = (key, depth, self.age, value, move)
+        self.stores += 1
+        deepest = entries[index]
+        if deepest is None or deepest[0] == key or depth >= deepest[1] \
+                or deepest[2] != self.age:
+            if deepest is not None and deepest[0] != key:
+                self.replacements += 1
+                # the replaced entry moves to the latest entry of the bucket
+                entries[index + 1] = deepest
+            elif entries[index + 1] is not None and entries[index + 1][0] == key:
+                # the key is not kept in both entries
+                entries[index + 1] = None
+            entries[index] = entry
+        else:
+            if entries[index + 1] is not None and entries[index + 1][0] != key:
+                self.replacements += 1
+            entries[index + 1] = entry
+
+    # Removes all the entries and resets the statistics
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+        self.age = 0
+        self.hits, self.misses, self.stores, self.replacements = 0, 0, 0, 0
+
+    # Returns the number of the stored entries
+    def __len__(self):
+        return sum(1 for entry in self.entries if entry is not None)
+
+    # Returns the statistics of the table as a dictionary
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "used": len(self),
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores, "replacements": self.replacements}